@@ -0,0 +1,315 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+arena.py
+--------
+
+Arena para comparar motores de otelo sin interfaz: juega muchas partidas
+entre dos motores (por ejemplo Negamax con bad_utility contra Negamax con
+hybrid_utility) repartidas en varios procesos, y reporta victorias,
+empates y derrotas, la diferencia de Elo con su intervalo de confianza, y
+los nodos por segundo y el tiempo por jugada de cada motor.
+
+Cada pareja de partidas empieza con las mismas jugadas de apertura al azar,
+una vez con cada motor en cada color. Los resultados se van escribiendo
+en un archivo JSONL (una partida por línea), de manera que si se
+interrumpe una corrida larga se puede continuar con el mismo comando:
+
+    python arena.py hybrid static -n 200 -j 4 --out arena.jsonl
+
+Con --clock cada motor tiene un reloj por partida (en segundos) que reparte
+entre sus jugadas con un time_manager.TimeManager, y se reporta cuántas
+veces se pasó del tiempo de una jugada.
+"""
+
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from time import perf_counter
+import argparse
+import json
+import math
+import os
+import random
+
+from bitboard import popcount
+from games import Negamax
+from mcts import MCTS
+from time_manager import TimeManager
+import othello
+
+__author__ = 'Rafael Castillo'
+
+# Motores que se pueden usar desde la línea de comandos: nombre de la
+# función de utilidad en othello y opciones de Negamax, o las opciones de
+# MCTS si engine es 'mcts'
+ENGINES = {'bad': {'utility': 'bad_utility'},
+           'static': {'utility': 'static_utility'},
+           'hybrid': {'utility': 'hybrid_utility'},
+           'hybrid-pvs': {'utility': 'hybrid_utility', 'pvs': True},
+           'mobility': {'utility': 'mobility_utility'},
+           'mcts': {'engine': 'mcts'}}
+
+
+def make_engine(spec, clock=None):
+    '''
+    Construye el Negamax descrito por spec (un diccionario como los de
+    ENGINES, que se puede mandar entre procesos). Si hay clock, el motor
+    maneja su tiempo con un TimeManager.
+    '''
+    options = dict(spec)
+    if options.pop('engine', 'negamax') == 'mcts':
+        time_manager = TimeManager() if clock is not None else None
+        return MCTS(playout=othello.random_playout,
+                    time_manager=time_manager, **options)
+    utility = getattr(othello, options.pop('utility'))
+    if clock is not None:
+        options.update(max_depth=64, time_manager=TimeManager())
+    return Negamax(utility, othello.simple_order, **options)
+
+
+def random_opening(plies, seed):
+    pos = othello.make_bit_reversi()
+    rng = random.Random(seed)
+    for _ in range(plies):
+        if pos.terminal:
+            break
+        pos = pos.make_move(rng.choice(pos.legal_moves))
+    return pos
+
+
+def choose_move(engine, pos, depth, max_time, remaining=None):
+    '''
+    Busca con profundización iterativa hasta depth si no es None, o con el
+    límite de tiempo max_time de Negamax (o con lo que le toque de
+    remaining, el tiempo que queda en el reloj, si no es None). MCTS no
+    tiene profundidad, así que siempre usa max_time (o remaining).
+    '''
+    if remaining is not None:
+        return engine(pos, remaining=remaining)
+    if depth is None or not hasattr(engine, 'search_depth'):
+        return engine(pos, max_time)
+    # Lo mismo que hace Negamax al empezar cada búsqueda, para que la
+    # tabla no trate como actuales las entradas de jugadas anteriores
+    engine.trans_table.new_search()
+    if hasattr(engine.order_moves, 'new_search'):
+        engine.order_moves.new_search()
+    score = move = None
+    for d in range(1, depth + 1):
+        score, move = engine.search_depth(pos, d, score)
+    return move
+
+
+def play_game(task):
+    '''
+    Juega una partida y regresa su registro. task es un diccionario con
+    game, los motores white y black (especificaciones de ENGINES), las
+    plies y seed de la apertura, y depth, max_time o clock de la búsqueda.
+    '''
+    clock = task.get('clock')
+    engines = {1: make_engine(task['white'], clock),
+               -1: make_engine(task['black'], clock)}
+    stats = {player: {'nodes': 0, 'time': 0.0, 'moves': 0}
+             for player in (1, -1)}
+    pos = random_opening(task['plies'], task['seed'])
+    while not pos.terminal:
+        player = pos.player
+        engine = engines[player]
+        nodes = engine.nodes
+        start = perf_counter()
+        remaining = (None if clock is None else
+                     max(clock - stats[player]['time'], 0.0))
+        move = choose_move(engine, pos, task['depth'], task['max_time'],
+                           remaining)
+        stats[player]['time'] += perf_counter() - start
+        stats[player]['nodes'] += engine.nodes - nodes
+        stats[player]['moves'] += 1
+        pos = pos.make_move(move)
+
+    if clock is not None:
+        for player in (1, -1):
+            stats[player].update(engines[player].time_manager
+                                 .overrun_stats())
+
+    # pos.terminal le da los empates a las negras, aquí se cuentan aparte
+    diff = popcount(pos.white) - popcount(pos.black)
+    record = dict(task)
+    record.update(result=(diff > 0) - (diff < 0), discs=diff,
+                  white_stats=stats[1], black_stats=stats[-1])
+    return record
+
+
+def make_tasks(engine_a, engine_b, games, plies=4, seed=0, depth=3,
+               max_time=None, clock=None):
+    '''
+    Las tareas de games partidas entre engine_a y engine_b (nombres de
+    ENGINES). Las partidas 2k y 2k + 1 tienen la misma apertura y los
+    colores cambiados; en las pares engine_a juega con blancas.
+    '''
+    tasks = []
+    for game in range(games):
+        a_white = game % 2 == 0
+        white, black = ((engine_a, engine_b) if a_white else
+                        (engine_b, engine_a))
+        tasks.append({'game': game, 'white_name': white,
+                      'black_name': black, 'white': ENGINES[white],
+                      'black': ENGINES[black], 'plies': plies,
+                      'seed': seed * 1000003 + game // 2, 'depth': depth,
+                      'max_time': max_time, 'clock': clock})
+    return tasks
+
+
+def load_results(path):
+    '''
+    Lee los registros de un archivo JSONL (si existe), ignorando una
+    última línea incompleta si la corrida se interrumpió a media escritura.
+    '''
+    records = []
+    if path is None or not os.path.exists(path):
+        return records
+    with open(path) as f:
+        for line in f:
+            try:
+                records.append(json.loads(line))
+            except ValueError:
+                break
+    return records
+
+
+def run_arena(engine_a, engine_b, games, out=None, workers=None, plies=4,
+              seed=0, depth=3, max_time=None, clock=None, verbose=True):
+    '''
+    Juega las partidas que falten (las que no estén ya en out) en un
+    ProcessPoolExecutor con workers procesos, agregando cada resultado a
+    out conforme termina. Regresa todos los registros de este
+    enfrentamiento, los nuevos y los que ya estaban.
+    '''
+    tasks = make_tasks(engine_a, engine_b, games, plies, seed, depth,
+                       max_time, clock)
+
+    def key(record):
+        return (record['game'], record['white_name'], record['black_name'],
+                record['plies'], record['seed'], record['depth'],
+                record['max_time'], record.get('clock'))
+
+    wanted = {key(task) for task in tasks}
+    records = [r for r in load_results(out) if key(r) in wanted]
+    done = {key(r) for r in records}
+    pending = [task for task in tasks if key(task) not in done]
+    if verbose and done:
+        print('{} partidas ya estaban en {}'.format(len(done), out))
+
+    f = open(out, 'a') if out is not None else None
+    try:
+        with ProcessPoolExecutor(workers) as pool:
+            futures = [pool.submit(play_game, task) for task in pending]
+            for i, future in enumerate(as_completed(futures), 1):
+                record = future.result()
+                records.append(record)
+                if f is not None:
+                    f.write(json.dumps(record) + '\n')
+                    f.flush()
+                if verbose:
+                    print('\r{}/{} partidas'.format(i, len(pending)),
+                          end='', flush=True)
+    finally:
+        if f is not None:
+            f.close()
+        if verbose and pending:
+            print()
+    return records
+
+
+def elo(score):
+    '''
+    Diferencia de Elo que corresponde a una fracción de puntos score.
+    '''
+    if score <= 0:
+        return -math.inf
+    if score >= 1:
+        return math.inf
+    return -400 * math.log10(1 / score - 1)
+
+
+def summarize(records, engine_a, engine_b):
+    '''
+    Regresa un diccionario con el resumen de los registros desde el punto
+    de vista de engine_a: victorias, empates, derrotas, la diferencia de
+    Elo con su intervalo de confianza de 95%, y los nodos por segundo y el
+    segundos por jugada de cada motor.
+    '''
+    points = []
+    engines = {engine_a: {'nodes': 0, 'time': 0.0, 'moves': 0,
+                          'overruns': 0},
+               engine_b: {'nodes': 0, 'time': 0.0, 'moves': 0,
+                          'overruns': 0}}
+    for r in records:
+        a_color = 1 if r['white_name'] == engine_a else -1
+        points.append((1 + a_color * r['result']) / 2)
+        for name, key in ((r['white_name'], 'white_stats'),
+                          (r['black_name'], 'black_stats')):
+            for field in ('nodes', 'time', 'moves'):
+                engines[name][field] += r[key][field]
+            engines[name]['overruns'] += r[key].get('overruns', 0)
+
+    n = len(points)
+    score = sum(points) / n if n else 0.5
+    deviation = (math.sqrt(sum((p - score) ** 2 for p in points) / n)
+                 if n else 0.0)
+    margin = 1.96 * deviation / math.sqrt(n) if n else 0.0
+    summary = {'games': n,
+               'wins': points.count(1.0),
+               'draws': points.count(0.5),
+               'losses': points.count(0.0),
+               'score': score,
+               'elo': elo(score),
+               'elo_low': elo(score - margin),
+               'elo_high': elo(score + margin)}
+    for name, stats in engines.items():
+        summary[name] = {
+            'nodes_per_second': (stats['nodes'] / stats['time']
+                                 if stats['time'] else 0.0),
+            'time_per_move': (stats['time'] / stats['moves']
+                              if stats['moves'] else 0.0),
+            'overruns': stats['overruns']}
+    return summary
+
+
+def print_summary(summary, engine_a, engine_b):
+    print('{} contra {}: {} partidas'.format(engine_a, engine_b,
+                                             summary['games']))
+    print('  +{wins} ={draws} -{losses}  ({score:.1%})'.format(**summary))
+    print('  Elo {elo:+.0f}  [{elo_low:+.0f}, {elo_high:+.0f}]'
+          .format(**summary))
+    for name in (engine_a, engine_b):
+        print('  {:12} {:8.0f} nodos/s  {:6.3f} s/jugada  {} excesos'.format(
+            name, summary[name]['nodes_per_second'],
+            summary[name]['time_per_move'], summary[name]['overruns']))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[1])
+    parser.add_argument('engine_a', choices=sorted(ENGINES))
+    parser.add_argument('engine_b', choices=sorted(ENGINES))
+    parser.add_argument('-n', '--games', type=int, default=100)
+    parser.add_argument('-j', '--workers', type=int, default=None)
+    parser.add_argument('--plies', type=int, default=4,
+                        help='jugadas de apertura al azar')
+    parser.add_argument('--depth', type=int, default=3)
+    parser.add_argument('--max-time', type=float, default=None,
+                        help='segundos por jugada (en lugar de --depth)')
+    parser.add_argument('--clock', type=float, default=None,
+                        help='segundos por partida para cada motor')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--out', default=None, help='archivo JSONL')
+    args = parser.parse_args()
+
+    depth = (None if args.max_time is not None or args.clock is not None
+             else args.depth)
+    if args.engine_a == args.engine_b:
+        parser.error('engine_a y engine_b tienen que ser distintos')
+    if depth is not None and 'mcts' in (args.engine_a, args.engine_b):
+        parser.error('mcts necesita --max-time o --clock')
+    records = run_arena(args.engine_a, args.engine_b, args.games, args.out,
+                        args.workers, args.plies, args.seed, depth,
+                        args.max_time, args.clock)
+    print_summary(summarize(records, args.engine_a, args.engine_b),
+                  args.engine_a, args.engine_b)
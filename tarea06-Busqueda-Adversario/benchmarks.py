@@ -0,0 +1,540 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+benchmarks.py
+-------------
+
+Mediciones de rendimiento de los motores de juego. Cada función
+imprime sus resultados y se puede llamar desde la línea de comandos:
+
+    python benchmarks.py conecta4
+
+sin argumentos se corren todas.
+
+"""
+from time import perf_counter
+import gc
+import os
+import random
+import sys
+
+from busquedas_adversarios import minimax, minimax_paralelo, minimax_t
+from conecta4 import ConectaCuatro, ConectaCuatroBits
+from conecta4 import ConectaCuatroLineas, ConectaCuatroBitsLineas
+from conecta4 import utilidad_c4, ordena_jugadas
+from conecta4 import utilidad_amenazas, cuenta_abiertas
+from games import Negamax, MutableNegamax, inf
+from transposition import TranspositionTable
+from bitboard import popcount
+from move_ordering import KillerHistoryOrder
+from othello import make_reversi, make_bit_reversi, MutableReversiPosition
+from othello import hybrid_utility, simple_order, batch_hybrid_utility
+from othello import bit_hybrid_utility, SIMPLE_ORDER_GROUPS, decode_move
+from search_stats import SearchStats
+from tictactoe import Gato
+
+
+def perft(juego, d):
+    """
+    Cuenta los nodos del árbol de juego hasta profundidad d (sin poda),
+    útil para comparar la velocidad de la generación de jugadas y para
+    verificar que dos implementaciones del mismo juego coinciden.
+
+    """
+    if d == 0 or juego.terminal() is not None:
+        return 1
+    nodos = 1
+    for jugada in list(juego.jugadas_legales()):
+        juego.hacer_jugada(jugada)
+        nodos += perft(juego, d - 1)
+        juego.deshacer_jugada()
+    return nodos
+
+
+def verifica(condicion, mensaje):
+    """
+    Termina con error (código de salida 1) si no se cumple condicion, de
+    manera que las revisiones de los benchmarks detectan regresiones.
+
+    """
+    if not condicion:
+        sys.exit("ERROR: " + mensaje)
+
+
+def con_contador(clase):
+    """
+    Regresa una subclase de clase que cuenta las jugadas realizadas
+    (uno por nodo visitado en minimax) en el atributo nodos.
+
+    """
+    class Contador(clase):
+        nodos = 0
+
+        def hacer_jugada(self, jugada):
+            self.nodos += 1
+            super().hacer_jugada(jugada)
+
+    Contador.__name__ = clase.__name__
+    return Contador
+
+
+def conecta4(d_perft=6, d_minimax=6, apertura=(3, 3, 2, 4)):
+    """
+    Nodos por segundo de ConectaCuatro (lista) contra ConectaCuatroBits,
+    con perft y con minimax a profundidad fija desde una posición
+    después de las jugadas de apertura.
+
+    """
+    print("Conecta 4: lista contra bitboards".center(60))
+    resultados = {}
+    for clase in (ConectaCuatro, ConectaCuatroBits):
+        juego = clase()
+        for jugada in apertura:
+            juego.hacer_jugada(jugada)
+        t0 = perf_counter()
+        nodos = perft(juego, d_perft)
+        perft_t = perf_counter() - t0
+
+        juego = con_contador(clase)()
+        for jugada in apertura:
+            juego.hacer_jugada(jugada)
+        juego.nodos = 0
+        t0 = perf_counter()
+        jugada = minimax(juego, dmax=d_minimax, utilidad=utilidad_c4,
+                         ordena_jugadas=ordena_jugadas)
+        minimax_t = perf_counter() - t0
+
+        resultados[clase.__name__] = (nodos, jugada)
+        print("{:18} perft({}): {:8} nodos, {:9.0f} nodos/s".format(
+            clase.__name__, d_perft, nodos, nodos / perft_t))
+        print("{:18} minimax({}): {:6} nodos, {:9.0f} nodos/s, jugada {}"
+              .format(clase.__name__, d_minimax, juego.nodos,
+                      juego.nodos / minimax_t, jugada))
+
+    if len(set(resultados.values())) != 1:
+        print("¡Las implementaciones no coinciden!", resultados)
+
+
+def transposiciones(dmax=6, jugadas=8):
+    """
+    Nodos que visita minimax en ConectaCuatro con y sin tabla de
+    transposición, jugando una partida de la máquina contra sí misma y
+    reutilizando la misma tabla de una jugada a la siguiente.
+
+    """
+    print("Conecta 4: minimax con y sin tabla de transposición".center(60))
+    partidas, totales = [], []
+    for transp in (None, TranspositionTable(1 << 18)):
+        juego = con_contador(ConectaCuatroBits)()
+        nodos, t0 = [], perf_counter()
+        for _ in range(jugadas):
+            n0 = juego.nodos
+            jugada = minimax(juego, dmax=dmax, utilidad=utilidad_c4,
+                             ordena_jugadas=ordena_jugadas, transp=transp)
+            nodos.append(juego.nodos - n0)
+            juego.hacer_jugada(jugada)
+            if juego.terminal() is not None:
+                break
+        print("{:10} {:8} nodos en {:6.2f} s, por jugada: {}".format(
+            'sin tabla' if transp is None else 'con tabla', sum(nodos),
+            perf_counter() - t0, nodos))
+        print("           partida: {}".format(juego.historial))
+        partidas.append(list(juego.historial))
+        totales.append(sum(nodos))
+    verifica(partidas[0] == partidas[1],
+             "con tabla se escogen otras jugadas que sin tabla")
+    verifica(totales[1] < totales[0],
+             "con tabla no se visitan menos nodos que sin tabla")
+
+
+def paralelo(dmax=8, apertura=(3, 3, 2)):
+    """
+    minimax serial (con una tabla de transposición nueva) contra
+    minimax_paralelo con un proceso por núcleo, en ConectaCuatro.
+
+    """
+    print("Conecta 4: minimax serial contra paralelo ({} núcleos)"
+          .format(os.cpu_count()).center(60))
+    juego = ConectaCuatroBits()
+    for jugada in apertura:
+        juego.hacer_jugada(jugada)
+
+    t0 = perf_counter()
+    serial = minimax(juego, dmax=dmax, utilidad=utilidad_c4,
+                     ordena_jugadas=ordena_jugadas,
+                     transp=TranspositionTable(1 << 18))
+    t_serial = perf_counter() - t0
+    t0 = perf_counter()
+    en_paralelo = minimax_paralelo(juego, dmax=dmax, utilidad=utilidad_c4,
+                                   ordena_jugadas=ordena_jugadas)
+    t_paralelo = perf_counter() - t0
+    print("serial:   jugada {}, {:6.2f} s".format(serial, t_serial))
+    print("paralelo: jugada {}, {:6.2f} s (x{:.2f})".format(
+        en_paralelo, t_paralelo, t_serial / t_paralelo))
+
+
+def ordenamiento(d_c4=7, d_othello=5, jugadas=6):
+    """
+    Nodos visitados con el ordenamiento estático contra jugadas asesinas e
+    historia (KillerHistoryOrder), en ConectaCuatro con minimax y en otelo
+    con Negamax, jugando unas cuantas jugadas de la máquina contra sí misma.
+
+    """
+    print("Ordenamiento estático contra killer/historia".center(60))
+    for orden in (ordena_jugadas, KillerHistoryOrder(ordena_jugadas)):
+        juego = con_contador(ConectaCuatroBits)()
+        transp = TranspositionTable(1 << 18)
+        t0 = perf_counter()
+        for _ in range(jugadas):
+            juego.hacer_jugada(minimax(juego, dmax=d_c4 - 1,
+                                       utilidad=utilidad_c4,
+                                       ordena_jugadas=orden, transp=transp))
+        print("conecta 4 {:20} {:8} nodos, {:6.2f} s".format(
+            type(orden).__name__ if hasattr(orden, 'cutoff') else
+            orden.__name__, juego.nodos, perf_counter() - t0))
+
+    for orden in (simple_order, KillerHistoryOrder(simple_order)):
+        contador = [0]
+
+        def utilidad(pos):
+            contador[0] += 1
+            return hybrid_utility(pos)
+
+        motor = Negamax(utilidad, orden)
+        pos = make_bit_reversi()
+        t0 = perf_counter()
+        for _ in range(jugadas):
+            motor.trans_table.new_search()
+            if hasattr(orden, 'new_search'):
+                orden.new_search()
+            _, jugada = motor.nega_run(pos, d_othello, -inf, inf, pos.player)
+            pos = pos.make_move(jugada)
+        print("otelo     {:20} {:8} hojas, {:6.2f} s".format(
+            type(orden).__name__ if hasattr(orden, 'cutoff') else
+            orden.__name__, contador[0], perf_counter() - t0))
+
+
+def perft_posicion(pos, d):
+    """
+    Igual que perft, pero para posiciones inmutables (games.Position).
+
+    """
+    if d == 0 or pos.terminal:
+        return 1
+    return 1 + sum(perft_posicion(hijo, d - 1) for hijo in pos.child_nodes)
+
+
+def othello(d_perft=5, d_negamax=5):
+    """
+    Nodos por segundo de ReversiPosition (numpy) contra BitReversiPosition,
+    con perft y con una búsqueda Negamax(hybrid_utility) a profundidad fija.
+
+    """
+    print("Otelo: numpy contra bitboards".center(60))
+    resultados = {}
+    for inicial in (make_reversi, make_bit_reversi):
+        pos = inicial()
+        nombre = type(pos).__name__
+        t0 = perf_counter()
+        nodos = perft_posicion(pos, d_perft)
+        perft_t = perf_counter() - t0
+
+        motor = Negamax(hybrid_utility, simple_order)
+        t0 = perf_counter()
+        valor, jugada = motor.nega_run(pos, d_negamax, -inf, inf, pos.player)
+        negamax_t = perf_counter() - t0
+
+        resultados[nombre] = (nodos, valor, tuple(map(int, jugada)))
+        print("{:18} perft({}): {:7} nodos, {:8.0f} nodos/s".format(
+            nombre, d_perft, nodos, nodos / perft_t))
+        print("{:18} negamax({}): {:.3f} s, jugada {}".format(
+            nombre, d_negamax, negamax_t, jugada))
+
+    if len(set(resultados.values())) != 1:
+        print("¡Las implementaciones no coinciden!", resultados)
+
+
+def posiciones_otelo(n=4, aperturas=8, semilla=0):
+    """
+    Regresa n posiciones de otelo (BitReversiPosition) después de jugar
+    al azar unas cuantas jugadas de apertura.
+
+    """
+    rnd = random.Random(semilla)
+    posiciones = []
+    for _ in range(n):
+        pos = make_bit_reversi()
+        for _ in range(aperturas):
+            pos = pos.make_move(rnd.choice(pos.legal_moves))
+        posiciones.append(pos)
+    return posiciones
+
+
+def pvs(dmax=6, aspiracion=8):
+    """
+    Nodos por profundidad de Negamax simple, con PVS, y con PVS y ventanas
+    de aspiración, sumados sobre varias posiciones de otelo.
+
+    """
+    print("Otelo: Negamax contra PVS y aspiración".center(60))
+    modos = (('negamax', {}),
+             ('pvs', {'pvs': True}),
+             ('pvs+aspiración', {'pvs': True, 'aspiration': aspiracion}))
+    valores = {}
+    for nombre, opciones in modos:
+        nodos = [0] * (dmax + 1)
+        t0 = perf_counter()
+        for i, pos in enumerate(posiciones_otelo()):
+            motor = Negamax(hybrid_utility, simple_order, **opciones)
+            valor = None
+            for d in range(1, dmax + 1):
+                n0 = motor.nodes
+                valor, _ = motor.search_depth(pos, d, valor)
+                nodos[d] += motor.nodes - n0
+                valores.setdefault((i, d), set()).add(float(valor))
+        print("{:15} {:6.2f} s, nodos por profundidad: {}".format(
+            nombre, perf_counter() - t0, nodos[1:]))
+    if any(len(v) != 1 for v in valores.values()):
+        print("¡Los valores no coinciden!")
+
+
+def simetrias(d_c4=7, d_othello=5):
+    """
+    Entradas usadas en la tabla de transposición, aciertos y nodos con
+    llaves normales y con llaves canónicas (que juntan las posiciones
+    simétricas), desde la posición inicial del gato, el conecta 4 y el
+    otelo.
+
+    """
+    print("Llaves de la tabla: normales contra canónicas".center(60))
+    for canonica in (False, True):
+        nombre = 'canónicas' if canonica else 'normales'
+        for clase, opciones in ((Gato, {}),
+                                (ConectaCuatroBits,
+                                 {'dmax': d_c4 - 1, 'utilidad': utilidad_c4,
+                                  'ordena_jugadas': ordena_jugadas})):
+            juego = con_contador(clase)()
+            juego.canonica = canonica
+            transp = TranspositionTable(1 << 20)
+            minimax(juego, transp=transp, **opciones)
+            print("{:18} {:9} {:7} entradas, {:5.1%} aciertos, {:7} nodos"
+                  .format(clase.__name__, nombre, len(transp),
+                          transp.stats()['hit_rate'], juego.nodos))
+
+        motor = Negamax(hybrid_utility, simple_order, canonical=canonica)
+        pos = make_bit_reversi()
+        for d in range(1, d_othello + 1):
+            motor.search_depth(pos, d)
+        print("{:18} {:9} {:7} entradas, {:5.1%} aciertos, {:7} nodos"
+              .format('Otelo', nombre, len(motor.trans_table),
+                      motor.trans_table.stats()['hit_rate'], motor.nodes))
+
+
+def evaluacion(partidas=200, dmax=6, semilla=0):
+    """
+    Revisa que las líneas abiertas que LineasAbiertas mantiene al hacer y
+    deshacer jugadas coincidan con cuenta_abiertas (calculadas desde cero)
+    en partidas al azar, y compara la velocidad de utilidad_c4 contra
+    utilidad_amenazas, sola y dentro de minimax.
+
+    """
+    print("Conecta 4: evaluación incremental".center(60))
+    rnd = random.Random(semilla)
+    posiciones, errores = [], 0
+    for clase in (ConectaCuatroLineas, ConectaCuatroBitsLineas):
+        for _ in range(partidas // 2):
+            juego = clase()
+            while juego.terminal() is None:
+                juego.hacer_jugada(rnd.choice(list(juego.jugadas_legales())))
+                errores += juego.abiertas != cuenta_abiertas(juego.x)
+                if rnd.random() < 0.2:
+                    juego.deshacer_jugada()
+                    errores += juego.abiertas != cuenta_abiertas(juego.x)
+            posiciones.append(juego)
+            while juego.historial:
+                juego.deshacer_jugada()
+                errores += juego.abiertas != cuenta_abiertas(juego.x)
+    print("{} partidas al azar, {} diferencias con cuenta_abiertas".format(
+        partidas, errores))
+    verifica(errores == 0, "las líneas abiertas no coinciden con "
+             "cuenta_abiertas")
+
+    for utilidad in (utilidad_c4, utilidad_amenazas):
+        juego = con_contador(ConectaCuatroBitsLineas)()
+        for jugada in (3, 3, 2, 4):
+            juego.hacer_jugada(jugada)
+        t0 = perf_counter()
+        for _ in range(20000):
+            utilidad(juego)
+        t_hoja = (perf_counter() - t0) / 20000
+        juego.nodos = 0
+        t0 = perf_counter()
+        jugada = minimax(juego, dmax=dmax, utilidad=utilidad,
+                         ordena_jugadas=ordena_jugadas)
+        t = perf_counter() - t0
+        print("{:18} {:5.2f} µs por hoja, minimax({}): {:6} nodos, "
+              "{:7.0f} nodos/s, jugada {}".format(
+                  utilidad.__name__, 1e6 * t_hoja, dmax, juego.nodos,
+                  juego.nodos / t, jugada))
+
+
+def lotes(dmax=5, repeticiones=20):
+    """
+    Evaluaciones por segundo de hybrid_utility posición por posición contra
+    batch_hybrid_utility sobre todas las hijas de cada posición a la vez, y
+    una búsqueda Negamax a profundidad fija con y sin batch_utility.
+
+    """
+    print("Otelo: evaluación de hojas una por una contra en lote".center(60))
+    hermanas = [[pos.make_move(jugada) for jugada in pos.legal_moves]
+                for pos in posiciones_otelo(n=16, aperturas=12)]
+    n = sum(len(hijas) for hijas in hermanas) * repeticiones
+    t0 = perf_counter()
+    for _ in range(repeticiones):
+        for hijas in hermanas:
+            for hija in hijas:
+                hybrid_utility(hija)
+    t_una = perf_counter() - t0
+    t0 = perf_counter()
+    for _ in range(repeticiones):
+        for hijas in hermanas:
+            batch_hybrid_utility(hijas)
+    t_lote = perf_counter() - t0
+    print("una por una: {:8.0f} evaluaciones/s".format(n / t_una))
+    print("en lote:     {:8.0f} evaluaciones/s (x{:.2f})".format(
+        n / t_lote, t_una / t_lote))
+
+    valores = {}
+    for nombre, lote in (('una por una', None),
+                         ('en lote', batch_hybrid_utility)):
+        t0, nodos = perf_counter(), 0
+        for i, pos in enumerate(posiciones_otelo()):
+            motor = Negamax(hybrid_utility, simple_order,
+                            batch_utility=lote)
+            valor, _ = motor.search_depth(pos, dmax)
+            valores.setdefault(i, set()).add(float(valor))
+            nodos += motor.nodes
+        t = perf_counter() - t0
+        print("negamax({}) {:11} {:7} nodos, {:6.2f} s, {:7.0f} nodos/s"
+              .format(dmax, nombre, nodos, t, nodos / t))
+    if any(len(v) != 1 for v in valores.values()):
+        print("¡Los valores no coinciden!")
+
+
+def diferencia_fichas(pos):
+    # Utilidad que solo usa los bitboards (sin armar el tablero de numpy)
+    return popcount(pos.white) - popcount(pos.black)
+
+
+def mutable(dmax=6):
+    """
+    Negamax con posiciones inmutables (BitReversiPosition, una nueva por
+    nodo) contra MutableNegamax (make/unmake sobre la misma posición, sin
+    crear objetos por nodo): tiempo, nodos por segundo y recolecciones de
+    basura de la generación 0 durante la búsqueda, con hybrid_utility (que
+    arma el tablero de numpy en cada hoja) y con utilidades que solo usan
+    los bitboards. Los dos motores prueban las jugadas en el mismo orden,
+    así que deben dar los mismos resultados.
+
+    """
+    print("Otelo: posiciones inmutables contra make/unmake".center(60))
+    por_utilidad = {}
+    for utilidad in (hybrid_utility, bit_hybrid_utility, diferencia_fichas):
+        motores = (('inmutable', Negamax(utilidad, simple_order, pvs=True)),
+                   ('make/unmake', MutableNegamax(
+                       utilidad, SIMPLE_ORDER_GROUPS, pvs=True,
+                       to_mutable=MutableReversiPosition.from_position,
+                       decode_move=decode_move)))
+        valores = {}
+        for nombre, motor in motores:
+            gc0 = gc.get_stats()[0]['collections']
+            t0 = perf_counter()
+            for i, pos in enumerate(posiciones_otelo()):
+                valor, jugada = motor.search_depth(pos, dmax)
+                valores.setdefault(i, set()).add((float(valor), jugada))
+            t = perf_counter() - t0
+            print("{:18} {:11} {:7} nodos, {:6.2f} s, {:6.0f} nodos/s, "
+                  "{:4} recolecciones".format(
+                      utilidad.__name__, nombre, motor.nodes, t,
+                      motor.nodes / t,
+                      gc.get_stats()[0]['collections'] - gc0))
+        verifica(all(len(v) == 1 for v in valores.values()),
+                 "los resultados de los dos motores no coinciden con " +
+                 utilidad.__name__)
+        por_utilidad[utilidad] = valores
+    verifica(por_utilidad[hybrid_utility] == por_utilidad[bit_hybrid_utility],
+             "bit_hybrid_utility no da lo mismo que hybrid_utility")
+
+
+def revisa_estadisticas(stats, nombre):
+    """
+    Revisa las relaciones que siempre deben cumplir los contadores de un
+    SearchStats, para que un contador que se deje de llenar (o se llene
+    dos veces) no pase desapercibido.
+
+    """
+    verifica(stats.nodes > 0, nombre + ": no se contaron nodos")
+    verifica(stats.tt_hits <= stats.tt_probes,
+             nombre + ": más aciertos que consultas a la tabla")
+    verifica(stats.tt_cutoffs <= stats.tt_hits,
+             nombre + ": más cortes por la tabla que aciertos")
+    verifica(stats.first_move_cutoffs <= stats.cutoffs,
+             nombre + ": más cortes de la primera jugada que cortes")
+    verifica(sum(it['nodes'] for it in stats.iterations) <= stats.nodes,
+             nombre + ": las iteraciones suman más nodos que la búsqueda")
+    verifica(any(it['completed'] for it in stats.iterations),
+             nombre + ": no se completó ninguna iteración")
+    profundidades = [it['depth'] for it in stats.iterations]
+    verifica(profundidades == sorted(set(profundidades)),
+             nombre + ": las iteraciones no van en profundidad creciente")
+
+
+def estadisticas(tmax=2, archivo=None):
+    """
+    Estadísticas de búsqueda (SearchStats) de minimax_t en ConectaCuatro y
+    de Negamax en otelo, con y sin killer/historia. Si se da archivo, se
+    le agrega una línea de JSON por búsqueda, para comparar después contra
+    otras versiones del código.
+
+    """
+    print("Estadísticas de búsqueda".center(60))
+    for orden in (ordena_jugadas, KillerHistoryOrder(ordena_jugadas)):
+        juego = ConectaCuatroBits()
+        for jugada in (3, 3, 2, 4):
+            juego.hacer_jugada(jugada)
+        nombre = type(orden).__name__ if hasattr(orden, 'cutoff') else \
+            orden.__name__
+        stats = minimax_t(juego, tmax, utilidad_c4, orden,
+                          estadisticas=SearchStats()).estadisticas
+        print("conecta 4 {:20} {}".format(nombre, stats))
+        revisa_estadisticas(stats, "conecta 4 " + nombre)
+        if archivo is not None:
+            stats.dump(archivo, juego='conecta4', orden=nombre, tmax=tmax)
+
+    for orden in (simple_order, KillerHistoryOrder(simple_order)):
+        nombre = type(orden).__name__ if hasattr(orden, 'cutoff') else \
+            orden.__name__
+        _, stats = Negamax(hybrid_utility, orden)(
+            make_bit_reversi(), tmax, stats=SearchStats())
+        print("otelo     {:20} {}".format(nombre, stats))
+        revisa_estadisticas(stats, "otelo " + nombre)
+        if archivo is not None:
+            stats.dump(archivo, juego='otelo', orden=nombre, tmax=tmax)
+
+
+BENCHMARKS = {'conecta4': conecta4,
+              'transposiciones': transposiciones,
+              'paralelo': paralelo,
+              'ordenamiento': ordenamiento,
+              'pvs': pvs,
+              'simetrias': simetrias,
+              'evaluacion': evaluacion,
+              'lotes': lotes,
+              'mutable': mutable,
+              'estadisticas': estadisticas,
+              'othello': othello}
+
+
+if __name__ == '__main__':
+    for nombre in sys.argv[1:] or BENCHMARKS:
+        BENCHMARKS[nombre]()
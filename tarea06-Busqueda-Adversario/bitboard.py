@@ -0,0 +1,138 @@
+"""
+bitboard.py
+-----------
+
+Operaciones de bitboards para el otelo. Un tablero de 8x8 se guarda como
+un entero de 64 bits por jugador, donde la casilla (renglon, columna)
+corresponde al bit renglon * 8 + columna.
+
+La generación de jugadas y el cálculo de fichas volteadas se hacen con
+rellenos ocluidos de Kogge-Stone: en lugar de caminar casilla por casilla
+en cada dirección, se propagan todas las fichas a la vez con corrimientos
+de 1, 2 y 4 pasos.
+"""
+
+__author__ = 'Rafael Castillo'
+
+FULL = (1 << 64) - 1
+NOT_A_FILE = FULL ^ 0x0101010101010101
+NOT_H_FILE = FULL ^ 0x8080808080808080
+
+# (corrimiento, máscara de destino) para cada una de las 8 direcciones. La
+# máscara quita las fichas que se saldrían por un lado del tablero y
+# aparecerían por el otro.
+DIRECTIONS = ((1, NOT_A_FILE), (-1, NOT_H_FILE),
+              (8, FULL), (-8, FULL),
+              (9, NOT_A_FILE), (7, NOT_H_FILE),
+              (-7, NOT_A_FILE), (-9, NOT_H_FILE))
+
+try:
+    popcount = int.bit_count
+except AttributeError:  # Python < 3.10
+    def popcount(x):
+        return bin(x).count('1')
+
+
+def shift(x, n, mask):
+    return ((x << n) if n > 0 else (x >> -n)) & mask
+
+
+def occluded_fill(gen, pro, n, mask):
+    '''
+    Extiende gen en la dirección n mientras pase por casillas de pro.
+    '''
+    pro &= mask
+    if n > 0:
+        gen |= pro & (gen << n)
+        pro &= pro << n
+        gen |= pro & (gen << 2 * n)
+        pro &= pro << 2 * n
+        gen |= pro & (gen << 4 * n)
+    else:
+        n = -n
+        gen |= pro & (gen >> n)
+        pro &= pro >> n
+        gen |= pro & (gen >> 2 * n)
+        pro &= pro >> 2 * n
+        gen |= pro & (gen >> 4 * n)
+    return gen
+
+
+def moves_mask(own, opp):
+    '''
+    Regresa la máscara de casillas donde own puede tirar.
+    '''
+    empty = FULL ^ (own | opp)
+    moves = 0
+    for n, mask in DIRECTIONS:
+        run = shift(own, n, mask) & opp
+        if run:
+            run = occluded_fill(run, opp, n, mask)
+            moves |= shift(run, n, mask) & empty
+    return moves
+
+
+def flips(own, opp, square):
+    '''
+    Regresa la máscara de fichas de opp que se voltean si own tira en el
+    bit square.
+    '''
+    flipped = 0
+    for n, mask in DIRECTIONS:
+        run = shift(square, n, mask) & opp
+        if run:
+            run = occluded_fill(run, opp, n, mask)
+            if shift(run, n, mask) & own:
+                flipped |= run
+    return flipped
+
+
+def iter_squares(x):
+    '''
+    Genera los índices de los bits prendidos de x, del menor al mayor.
+    '''
+    while x:
+        low = x & -x
+        yield low.bit_length() - 1
+        x ^= low
+
+
+def flip_vertical(x):
+    '''
+    Refleja el tablero de arriba a abajo (el renglón r va al 7 - r).
+    '''
+    return int.from_bytes(x.to_bytes(8, 'little'), 'big')
+
+
+def mirror_horizontal(x):
+    '''
+    Refleja el tablero de izquierda a derecha (la columna c va a la 7 - c).
+    '''
+    x = ((x >> 1) & 0x5555555555555555) | ((x & 0x5555555555555555) << 1)
+    x = ((x >> 2) & 0x3333333333333333) | ((x & 0x3333333333333333) << 2)
+    return ((x >> 4) & 0x0f0f0f0f0f0f0f0f) | ((x & 0x0f0f0f0f0f0f0f0f) << 4)
+
+
+def flip_diagonal(x):
+    '''
+    Transpone el tablero (la casilla (r, c) va a la (c, r)).
+    '''
+    t = 0x0f0f0f0f00000000 & (x ^ (x << 28))
+    x ^= t ^ (t >> 28)
+    t = 0x3333000033330000 & (x ^ (x << 14))
+    x ^= t ^ (t >> 14)
+    t = 0x5500550055005500 & (x ^ (x << 7))
+    return x ^ t ^ (t >> 7)
+
+
+def symmetries(x):
+    '''
+    Regresa las 8 simetrías de x (rotaciones y reflejos), en el orden de
+    othello.SYMMETRIES.
+    '''
+    h = mirror_horizontal(x)
+    v = flip_vertical(x)
+    hv = flip_vertical(h)
+    return (x, h, v, hv,
+            flip_diagonal(x), flip_diagonal(v), flip_diagonal(h),
+            flip_diagonal(hv))
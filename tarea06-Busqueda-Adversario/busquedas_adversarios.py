@@ -15,7 +15,33 @@ Se ilustra con el juego del gato
 
 """
 
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import Value
+from queue import Queue
+from threading import Thread
 from time import perf_counter
+from random import Random
+from transposition import TranspositionTable
+
+
+def tabla_zobrist(n, semilla=2017):
+    """
+    Genera los números aleatorios de 64 bits para el hash de Zobrist de
+    un tablero de n casillas: uno por casilla para cada jugador (1 y -1)
+    y uno más para el turno. La semilla es fija para que el hash de una
+    posición sea el mismo entre ejecuciones (y entre procesos).
+
+    """
+    if n not in _tablas_zobrist:
+        rnd = Random(semilla + n)
+        _tablas_zobrist[n] = ({1: [rnd.getrandbits(64) for _ in range(n)],
+                               -1: [rnd.getrandbits(64) for _ in range(n)]},
+                              rnd.getrandbits(64))
+    return _tablas_zobrist[n]
+
+
+_tablas_zobrist = {}
 
 
 class JuegoSumaCeros2T:
@@ -46,7 +72,27 @@ class JuegoSumaCeros2T:
 
     3. hacer_jugada(jugada): Realiza la jugada, modifica el estado.
 
+    Además se mantiene self.hash, el hash de Zobrist del estado y del
+    jugador en turno, que sirve de llave para las tablas de
+    transposición. Para que se mantenga actualizado, hacer_jugada y
+    deshacer_jugada deben modificar el estado con pon_ficha y cambiar
+    de turno con cambia_turno.
+
+    Si el juego define simetrias y canonica es verdadero, también se
+    mantienen en paralelo los hashes de los estados simétricos
+    (hashes_simetricos), y las tablas de transposición usan como llave el
+    menor de todos (llave_canonica), de manera que las posiciones
+    simétricas comparten entrada. Con canonica falso (por omisión) no se
+    actualizan, para no hacer más lenta cada jugada.
+
     """
+    # Simetrías del tablero, sin contar la identidad, como parejas
+    # (casillas, jugadas): la simetría manda la casilla i a casillas[i] y
+    # la jugada j a jugadas[j]
+    simetrias = ()
+
+    _canonica = False
+
     def __init__(self, x0, jugador=1):
         """
         Inicializa el estado inicial del juego y el jugador
@@ -58,6 +104,79 @@ class JuegoSumaCeros2T:
         self.historial = []
         self.jugador = jugador
         self.n_movimientos = 0
+        self.zobrist, self.zobrist_turno = tabla_zobrist(len(x0))
+        turno = 0 if jugador == 1 else self.zobrist_turno
+        self.hash = turno ^ self._hash_tablero(x0, range(len(x0)))
+        self.hashes_simetricos = [turno ^ self._hash_tablero(x0, casillas)
+                                  for casillas, _ in self.simetrias]
+
+    def _hash_tablero(self, x, casillas):
+        # Hash de las fichas de x, con la casilla i movida a casillas[i]
+        h = 0
+        for i, xi in enumerate(x):
+            if xi != 0:
+                h ^= self.zobrist[xi][casillas[i]]
+        return h
+
+    @property
+    def canonica(self):
+        """
+        Si las tablas de transposición usan la llave canónica.
+
+        """
+        return self._canonica
+
+    @canonica.setter
+    def canonica(self, valor):
+        # Mientras no se usan los hashes simétricos no se actualizan, así
+        # que al prender canonica se calculan desde el estado actual
+        self._canonica = valor
+        if valor:
+            turno = 0 if self.jugador == 1 else self.zobrist_turno
+            self.hashes_simetricos = [turno ^ self._hash_tablero(self.x,
+                                                                 casillas)
+                                      for casillas, _ in self.simetrias]
+
+    def pon_ficha(self, i, valor):
+        """
+        Pone valor (1, -1 o 0 para vaciar) en la casilla i, actualizando
+        el hash de Zobrist.
+
+        """
+        anterior = self.x[i]
+        if anterior != 0:
+            self.hash ^= self.zobrist[anterior][i]
+        if valor != 0:
+            self.hash ^= self.zobrist[valor][i]
+        self.x[i] = valor
+        if self._canonica:
+            hashes = self.hashes_simetricos
+            for k, (casillas, _) in enumerate(self.simetrias):
+                j = casillas[i]
+                if anterior != 0:
+                    hashes[k] ^= self.zobrist[anterior][j]
+                if valor != 0:
+                    hashes[k] ^= self.zobrist[valor][j]
+
+    def cambia_turno(self):
+        self.jugador *= -1
+        self.hash ^= self.zobrist_turno
+        if self._canonica:
+            self.hashes_simetricos = [h ^ self.zobrist_turno
+                                      for h in self.hashes_simetricos]
+
+    def llave_canonica(self):
+        """
+        Regresa (llave, k): el menor de los hashes del estado y de sus
+        simetrías, y el índice en simetrias de la simetría que lo produce
+        (-1 si es el estado tal cual).
+
+        """
+        llave, k = self.hash, -1
+        for i, h in enumerate(self.hashes_simetricos):
+            if h < llave:
+                llave, k = h, i
+        return llave, k
 
     def jugadas_legales(self):
         raise NotImplementedError("Hay que desarrollar este método, pues")
@@ -72,31 +191,203 @@ class JuegoSumaCeros2T:
         raise NotImplementedError("Hay que desarrollar este método, pues")
 
 
-def minimax(juego, dmax=100, utilidad=None, ordena_jugadas=None, transp=None):
+class TiempoAgotado(Exception):
+    """
+    Se lanza dentro de la búsqueda cuando se pasa el tiempo límite.
+
+    """
+
+
+class ControlBusqueda:
+    """
+    Lleva la cuenta de los nodos visitados en una búsqueda y revisa,
+    cada tantos nodos, si ya se pasó el tiempo límite (en segundos de
+    perf_counter) o si alguien (por ejemplo otro hilo) llamó a detener(),
+    en cuyo caso lanza TiempoAgotado.
+
+    """
+    def __init__(self, limite=None, cada=1024):
+        self.limite = limite
+        self.cada = cada
+        self.nodos = 0
+        self.siguiente_revision = cada
+        self.detenida = False
+
+    def detener(self):
+        self.detenida = True
+
+    def visita(self):
+        self.nodos += 1
+        if self.nodos >= self.siguiente_revision:
+            self.siguiente_revision += self.cada
+            if self.detenida or (self.limite is not None and
+                                 perf_counter() > self.limite):
+                raise TiempoAgotado()
+
+
+def jugadas_sin_ordenar(juego):
+    return juego.jugadas_legales()
+
+
+def utilidad_terminal(juego):
+    return juego.terminal()
+
+
+def minimax(juego, dmax=100, utilidad=None, ordena_jugadas=None, transp=None,
+            control=None, estadisticas=None, nueva_busqueda=True):
     """
     Escoje una jugada legal para el jugador en turno, utilizando el
     método de minimax a una profundidad máxima de dmax, con una función de
     utilidad (para el jugador 1) definida por utilidad y un método
     de ordenación de jugadas específico
 
+    Si transp no es None, debe ser una tabla de transposición
+    (transposition.TranspositionTable) con llave juego.hash. En la tabla
+    se guardan cotas del valor de cada posición junto con su mejor jugada,
+    la cual se busca primero la siguiente vez que se visite la posición,
+    por lo que conviene usar la misma tabla de una jugada a la siguiente.
+
+    Si juego.canonica es verdadero, la llave de la tabla es la llave
+    canónica del juego (ver JuegoSumaCeros2T), y las jugadas guardadas se
+    traducen de y hacia la simetría correspondiente. Solo tiene sentido si
+    la función de utilidad también es simétrica.
+
+    Si ordena_jugadas tiene los métodos cutoff y new_search (como
+    move_ordering.KillerHistoryOrder), se le avisa de cada corte y del
+    inicio de cada búsqueda para que ordene dinámicamente.
+
+    Si control (un ControlBusqueda) no es None, se cuentan los nodos y la
+    búsqueda se interrumpe con TiempoAgotado al pasar su tiempo límite,
+    dejando el juego como estaba antes de llamar a minimax.
+
+    Si estadisticas (un search_stats.SearchStats) no es None, se llena con
+    los nodos, los cortes y el uso de la tabla de la búsqueda (como una
+    iteración de profundidad dmax + 1), y se regresa la pareja
+    (jugada, estadisticas) en lugar de solo la jugada.
+
+    Si nueva_busqueda es falso no se avisa a transp ni a ordena_jugadas del
+    inicio de una búsqueda (con new_search), para cuando minimax es parte
+    de una búsqueda más grande, como en pondera.
+
     """
     if ordena_jugadas is None:
-        def ordena_jugadas(juego):
-            return juego.jugadas_legales()
+        ordena_jugadas = jugadas_sin_ordenar
     if utilidad is None:
-        def utilidad(juego):
-            return juego.terminal()
+        utilidad = utilidad_terminal
         dmax = int(1e10)
+    if nueva_busqueda:
+        if transp is not None:
+            transp.new_search()
+        if hasattr(ordena_jugadas, 'new_search'):
+            ordena_jugadas.new_search()
+
+    primero = juego.jugador
+    entrada = consulta_tabla(transp, juego, primero)
+    jugadas = primero_la_jugada(ordena_jugadas(juego),
+                                entrada[3] if entrada else None)
+    alfa, mejor = -1e10, None
+    n_jugadas = len(juego.historial)
+    if estadisticas is not None:
+        estadisticas.start_iteration(dmax + 1)
+    try:
+        for jugada in jugadas:
+            valor = min_val(juego, jugada, dmax, utilidad, ordena_jugadas,
+                            alfa, 1e10, primero, transp, control,
+                            estadisticas)
+            if mejor is None or valor > alfa:
+                alfa, mejor = valor, jugada
+    except TiempoAgotado:
+        while len(juego.historial) > n_jugadas:
+            juego.deshacer_jugada()
+        if estadisticas is not None:
+            estadisticas.end_iteration(completed=False)
+        raise
+    guarda_tabla(transp, juego, dmax + 1, alfa, -1e10, 1e10, mejor, primero)
+    if estadisticas is not None:
+        estadisticas.end_iteration()
+        return mejor, estadisticas
+    return mejor
+
+
+def primero_la_jugada(jugadas, jugada):
+    """
+    Regresa la lista de jugadas con jugada (la de la tabla de
+    transposición) al principio, si es que está entre ellas.
+
+    """
+    jugadas = list(jugadas)
+    if jugada is not None and jugada in jugadas and jugadas[0] != jugada:
+        jugadas.remove(jugada)
+        jugadas.insert(0, jugada)
+    return jugadas
+
+
+def consulta_tabla(transp, juego, primero):
+    """
+    Busca la posición actual en la tabla de transposición.
 
-    return max((a for a in ordena_jugadas(juego)),
-               key=lambda a: min_val(juego, a, dmax, utilidad, ordena_jugadas,
-                                     -1e10, 1e10, juego.jugador, transp))
+    En la tabla los valores se guardan desde el punto de vista del
+    jugador 1, como una tupla (d, inferior, superior, jugada) donde el
+    valor de la posición está entre inferior y superior (que son iguales
+    si el valor es exacto) al buscar a profundidad d. Esta función regresa
+    la misma tupla, pero con las cotas desde el punto de vista de primero.
+
+    """
+    if transp is None:
+        return None
+    llave, jugadas = llave_tabla(juego)
+    entrada = transp.probe(llave)
+    if entrada is None or (primero == 1 and jugadas is None):
+        return entrada
+    d, inferior, superior, jugada = entrada
+    if jugadas is not None and jugada is not None:
+        jugada = jugadas.index(jugada)
+    if primero != 1:
+        inferior, superior = -superior, -inferior
+    return d, inferior, superior, jugada
+
+
+def guarda_tabla(transp, juego, d, valor, alfa, beta, jugada, primero):
+    """
+    Guarda en la tabla el resultado de una búsqueda con ventana
+    (alfa, beta) desde el punto de vista de primero: si valor <= alfa es
+    una cota superior, si valor >= beta es una cota inferior y si no es
+    el valor exacto.
+
+    """
+    if transp is None:
+        return
+    inferior = valor if valor > alfa else -1e10
+    superior = valor if valor < beta else 1e10
+    if primero != 1:
+        inferior, superior = -superior, -inferior
+    llave, jugadas = llave_tabla(juego)
+    if jugadas is not None and jugada is not None:
+        jugada = jugadas[jugada]
+    transp.store(llave, d, (d, inferior, superior, jugada))
+
+
+def llave_tabla(juego):
+    """
+    Regresa la llave de juego para la tabla de transposición, y la
+    traducción de jugadas de la simetría de la llave (None si es el estado
+    tal cual).
+
+    """
+    if not juego.canonica:
+        return juego.hash, None
+    llave, k = juego.llave_canonica()
+    return llave, (juego.simetrias[k][1] if k >= 0 else None)
 
 
 def min_val(juego, jugada, d, utilidad, ordena_jugadas,
-            alfa, beta, primero, transp):
+            alfa, beta, primero, transp, control=None, estadisticas=None):
 
     juego.hacer_jugada(jugada)
+    if control is not None:
+        control.visita()
+    if estadisticas is not None:
+        estadisticas.nodes += 1
 
     ganancia = juego.terminal()
     if ganancia is not None:
@@ -108,27 +399,48 @@ def min_val(juego, jugada, d, utilidad, ordena_jugadas,
         juego.deshacer_jugada()
         return primero * u
 
-    if transp is not None and tuple(juego.x) in transp:
-        d_tt, val_tt, tipo_tt = transp[tuple(juego.x)]
-        if d_tt >= d and tipo_tt is 'beta':
-            beta = min(alfa, val_tt)
-
-    for jugada_nueva in ordena_jugadas(juego):
-        beta = min(beta, max_val(juego, jugada_nueva, d - 1, utilidad,
-                                 ordena_jugadas, alfa, beta, primero, transp))
-        if beta <= alfa:
+    entrada = consulta_tabla(transp, juego, primero)
+    if estadisticas is not None and transp is not None:
+        estadisticas.tt_probes += 1
+        estadisticas.tt_hits += entrada is not None
+    if entrada is not None and entrada[0] >= d:
+        _, inferior, superior, _ = entrada
+        if inferior >= beta or superior <= alfa or inferior == superior:
+            juego.deshacer_jugada()
+            if estadisticas is not None:
+                estadisticas.tt_cutoffs += 1
+            return inferior if inferior >= beta else superior
+        alfa, beta = max(alfa, inferior), min(beta, superior)
+
+    beta_ini = beta
+    valor, mejor = 1e10, None
+    for i, jugada_nueva in enumerate(primero_la_jugada(
+            ordena_jugadas(juego), entrada[3] if entrada else None)):
+        v = max_val(juego, jugada_nueva, d - 1, utilidad, ordena_jugadas,
+                    alfa, beta, primero, transp, control, estadisticas)
+        if v < valor:
+            valor, mejor = v, jugada_nueva
+            beta = min(beta, valor)
+        if valor <= alfa:
+            if hasattr(ordena_jugadas, 'cutoff'):
+                ordena_jugadas.cutoff(juego, jugada_nueva, d)
+            if estadisticas is not None:
+                estadisticas.cutoffs += 1
+                estadisticas.first_move_cutoffs += i == 0
             break
-    else:
-        if transp is not None:
-            transp[tuple(juego.x)] = (d, beta, 'beta')
+    guarda_tabla(transp, juego, d, valor, alfa, beta_ini, mejor, primero)
     juego.deshacer_jugada()
-    return beta
+    return valor
 
 
 def max_val(juego, jugada, d, utilidad, ordena_jugadas,
-            alfa, beta, primero, transp):
+            alfa, beta, primero, transp, control=None, estadisticas=None):
 
     juego.hacer_jugada(jugada)
+    if control is not None:
+        control.visita()
+    if estadisticas is not None:
+        estadisticas.nodes += 1
 
     ganancia = juego.terminal()
     if ganancia is not None:
@@ -140,30 +452,333 @@ def max_val(juego, jugada, d, utilidad, ordena_jugadas,
         juego.deshacer_jugada()
         return primero * u
 
-    if transp is not None and tuple(juego.x) in transp:
-        d_tt, val_tt, tipo_tt = transp[tuple(juego.x)]
-        if d_tt >= d and tipo_tt is 'alfa':
-            alfa = max(alfa, val_tt)
+    entrada = consulta_tabla(transp, juego, primero)
+    if estadisticas is not None and transp is not None:
+        estadisticas.tt_probes += 1
+        estadisticas.tt_hits += entrada is not None
+    if entrada is not None and entrada[0] >= d:
+        _, inferior, superior, _ = entrada
+        if inferior >= beta or superior <= alfa or inferior == superior:
+            juego.deshacer_jugada()
+            if estadisticas is not None:
+                estadisticas.tt_cutoffs += 1
+            return inferior if inferior >= beta else superior
+        alfa, beta = max(alfa, inferior), min(beta, superior)
+
+    alfa_ini = alfa
+    valor, mejor = -1e10, None
+    for i, jugada_nueva in enumerate(primero_la_jugada(
+            ordena_jugadas(juego), entrada[3] if entrada else None)):
+        v = min_val(juego, jugada_nueva, d - 1, utilidad, ordena_jugadas,
+                    alfa, beta, primero, transp, control, estadisticas)
+        if v > valor:
+            valor, mejor = v, jugada_nueva
+            alfa = max(alfa, valor)
+        if valor >= beta:
+            if hasattr(ordena_jugadas, 'cutoff'):
+                ordena_jugadas.cutoff(juego, jugada_nueva, d)
+            if estadisticas is not None:
+                estadisticas.cutoffs += 1
+                estadisticas.first_move_cutoffs += i == 0
+            break
+    guarda_tabla(transp, juego, d, valor, alfa_ini, beta, mejor, primero)
+    juego.deshacer_jugada()
+    return valor
+
+
+def minimax_paralelo(juego, dmax=100, utilidad=None, ordena_jugadas=None,
+                     procesos=None):
+    """
+    Igual que minimax, pero las jugadas de la raíz se reparten entre
+    varios procesos (un ProcessPoolExecutor con procesos trabajadores).
+
+    La primera jugada (la que se espera sea la mejor) se busca aquí mismo
+    para tener una buena cota alfa, y el resto se busca en paralelo. Los
+    trabajadores comparten en memoria compartida la mejor alfa encontrada
+    hasta el momento, y la vuelven a leer antes de buscar cada respuesta
+    del contrario, así que aprovechan las cotas que encuentran los demás
+    mientras buscan. Cada trabajador usa su propia tabla de transposición.
+
+    juego, utilidad y ordena_jugadas tienen que poderse serializar con
+    pickle (funciones definidas a nivel de módulo, por ejemplo). El
+    resultado es la misma jugada que regresa minimax sin tabla de
+    transposición: la primera, en el orden de ordena_jugadas, con el mejor
+    valor.
 
-    for jugada_nueva in ordena_jugadas(juego):
-        alfa = max(alfa, min_val(juego, jugada_nueva, d - 1, utilidad,
-                                 ordena_jugadas, alfa, beta, primero, transp))
-        if beta <= alfa:
+    """
+    orden = ordena_jugadas if ordena_jugadas is not None else \
+        jugadas_sin_ordenar
+    jugadas = list(orden(juego))
+    if len(jugadas) < 2:
+        return jugadas[0] if jugadas else None
+
+    alfa = Value('d', -1e10)
+    with ProcessPoolExecutor(procesos, initializer=_inicia_trabajador,
+                             initargs=(alfa,)) as ejecutor:
+        _inicia_trabajador(alfa)
+        resultados = [_busca_raiz(juego, jugadas[0], dmax,
+                                  utilidad, ordena_jugadas)]
+        futuros = [ejecutor.submit(_busca_raiz, juego, jugada, dmax,
+                                   utilidad, ordena_jugadas)
+                   for jugada in jugadas[1:]]
+        resultados += [futuro.result() for futuro in futuros]
+
+    # Si la búsqueda de una jugada regresa un valor mayor que la última
+    # alfa con la que buscó es exacto, si no es una cota superior.
+    mejor_valor = max(valor for _, alfa_fin, valor in resultados
+                      if valor > alfa_fin)
+    for i, (jugada, alfa_fin, valor) in enumerate(resultados):
+        if valor > alfa_fin and valor == mejor_valor:
             break
+        if valor == mejor_valor:
+            # Una cota igual al mejor valor puede ser un empate con una
+            # jugada anterior en el orden, hay que buscarla completa
+            _inicia_trabajador(Value('d', -1e10))
+            if _busca_raiz(juego, jugada, dmax, utilidad,
+                           ordena_jugadas)[2] == mejor_valor:
+                break
+    return jugadas[i]
+
+
+_alfa_compartida = None
+_transp_trabajador = None
+
+
+def _inicia_trabajador(alfa):
+    global _alfa_compartida, _transp_trabajador
+    _alfa_compartida = alfa
+    _transp_trabajador = TranspositionTable(1 << 18)
+
+
+def _busca_raiz(juego, jugada, dmax, utilidad, ordena_jugadas):
+    """
+    Busca una jugada de la raíz con la alfa compartida. Es lo mismo que
+    min_val, solo que antes de cada respuesta del contrario se vuelve a
+    leer la alfa compartida, por si otro trabajador ya encontró una mejor.
+    Regresa la jugada, la última alfa con la que se buscó y el valor
+    encontrado (exacto si es mayor que esa alfa, si no una cota superior).
+
+    """
+    if ordena_jugadas is None:
+        ordena_jugadas = jugadas_sin_ordenar
+    if utilidad is None:
+        utilidad = utilidad_terminal
+        dmax = int(1e10)
+
+    primero, transp = juego.jugador, _transp_trabajador
+    alfa = _alfa_compartida.value
+    juego.hacer_jugada(jugada)
+    ganancia = juego.terminal()
+    if ganancia is not None:
+        valor = primero * ganancia
+    elif dmax == 0:
+        valor = primero * utilidad(juego)
     else:
-        if transp is not None:
-            transp[tuple(juego.x)] = (d, alfa, 'alfa')
+        entrada = consulta_tabla(transp, juego, primero)
+        valor, mejor = 1e10, None
+        for jugada_nueva in primero_la_jugada(
+                ordena_jugadas(juego), entrada[3] if entrada else None):
+            alfa = max(alfa, _alfa_compartida.value)
+            if valor <= alfa:
+                break
+            v = max_val(juego, jugada_nueva, dmax - 1, utilidad,
+                        ordena_jugadas, alfa, valor, primero, transp)
+            if v < valor:
+                valor, mejor = v, jugada_nueva
+        guarda_tabla(transp, juego, dmax, valor, alfa, 1e10, mejor, primero)
     juego.deshacer_jugada()
-    return alfa
+
+    if valor > alfa:
+        with _alfa_compartida.get_lock():
+            if valor > _alfa_compartida.value:
+                _alfa_compartida.value = valor
+    return jugada, alfa, valor
+
+
+ResultadoBusqueda = namedtuple('ResultadoBusqueda',
+                               ['jugada', 'profundidad', 'nodos',
+                                'variante', 'estadisticas'],
+                               defaults=(None,))
+
+
+def variante_principal(juego, transp, n=50):
+    """
+    Regresa la variante principal (la secuencia de mejores jugadas)
+    guardada en la tabla de transposición a partir del estado actual.
+
+    """
+    variante = []
+    while len(variante) < n:
+        entrada = consulta_tabla(transp, juego, 1)
+        if (entrada is None or entrada[3] is None or
+                entrada[3] not in juego.jugadas_legales()):
+            break
+        variante.append(entrada[3])
+        juego.hacer_jugada(entrada[3])
+        if juego.terminal() is not None:
+            break
+    for _ in variante:
+        juego.deshacer_jugada()
+    return variante
 
 
-def minimax_t(juego, tmax=5, utilidad=None, ordena_jugadas=None, transp=None):
+def minimax_t(juego, tmax=5, utilidad=None, ordena_jugadas=None, transp=None,
+              dmax=50, estadisticas=None, control=None):
+    """
+    Minimax con profundización iterativa: busca a profundidad 1, 2, ...
+    hasta dmax mientras haya tiempo, usando la misma tabla de
+    transposición en todas las iteraciones. Así cada iteración busca
+    primero la variante principal y las mejores jugadas que encontró la
+    anterior.
+
+    tmax es un límite duro: si se acaba el tiempo a media iteración, esta
+    se interrumpe y se regresa la jugada de la última iteración completa.
+    Tampoco se empieza una iteración que, según el factor de ramificación
+    efectivo de las anteriores, no alcanzaría a terminar.
+
+    Si control no es None (un ControlBusqueda), la búsqueda usa ese, de
+    manera que otro hilo puede llamar control.detener() para que termine
+    ya con la jugada de la última iteración completa.
+
+    Regresa un ResultadoBusqueda con la jugada, la profundidad alcanzada,
+    el número de nodos visitados y la variante principal, y estadisticas
+    (un search_stats.SearchStats, si se pasó uno) con una entrada por
+    iteración.
 
-    bf = len(list(juego.jugadas_legales()))
+    """
     t_ini = perf_counter()
-    for d in range(2, 50):
-        ta = perf_counter()
-        jugada = minimax(juego, d, utilidad, ordena_jugadas, transp=None)
+    if control is None:
+        control = ControlBusqueda()
+    control.limite = t_ini + tmax
+    if transp is None:
+        transp = TranspositionTable()
+
+    if utilidad is None:
+        # Sin función de utilidad solo tiene sentido buscar hasta el final
+        jugada = minimax(juego, utilidad=None, ordena_jugadas=ordena_jugadas,
+                         transp=transp, control=control,
+                         estadisticas=estadisticas)
+        if estadisticas is not None:
+            jugada, _ = jugada
+        return ResultadoBusqueda(jugada, None, control.nodos,
+                                 variante_principal(juego, transp),
+                                 estadisticas)
+
+    # Todas las iteraciones son una sola búsqueda: la tabla no envejece y
+    # el ordenamiento conserva lo aprendido de una iteración a la otra
+    transp.new_search()
+    if hasattr(ordena_jugadas, 'new_search'):
+        ordena_jugadas.new_search()
+    resultado = ResultadoBusqueda(None, 0, 0, [])
+    nodos_antes, t_iteracion = 0, 0
+    for d in range(1, dmax + 1):
+        nodos_ini, ta = control.nodos, perf_counter()
+        try:
+            jugada = minimax(juego, d - 1, utilidad, ordena_jugadas,
+                             transp=transp, control=control,
+                             estadisticas=estadisticas,
+                             nueva_busqueda=False)
+        except TiempoAgotado:
+            break
         tb = perf_counter()
-        if bf * (tb - ta) > t_ini + tmax - tb:
-            return jugada
+        if estadisticas is not None:
+            jugada, _ = jugada
+        resultado = ResultadoBusqueda(jugada, d, control.nodos,
+                                      variante_principal(juego, transp, d))
+
+        nodos = control.nodos - nodos_ini
+        ramificacion = nodos / nodos_antes if nodos_antes else nodos
+        nodos_antes, t_iteracion = nodos, tb - ta
+        if ramificacion * t_iteracion > t_ini + tmax - tb:
+            break
+
+    if resultado.jugada is None:
+        # Ni la primera iteración alcanzó a terminar
+        resultado = ResultadoBusqueda(next(iter(juego.jugadas_legales())),
+                                      0, control.nodos, [])
+    return resultado._replace(nodos=control.nodos,
+                              estadisticas=estadisticas)
+
+
+def pondera(juego, utilidad=None, ordena_jugadas=None, transp=None,
+            control=None, dmax=50):
+    """
+    Piensa en el tiempo del contrario: con juego en el turno del contrario,
+    busca con profundización iterativa la posición que queda después de
+    cada una de sus jugadas (en el orden de ordena_jugadas, así que la que
+    se espera primero), guardando los resultados en transp, hasta que se
+    llame control.detener() o se llegue a dmax.
+
+    Cuando llega la jugada del contrario, la búsqueda de la respuesta (con
+    la misma tabla) encuentra ya buscado el subárbol de esa posición. juego
+    queda como estaba.
+
+    Toda la sesión cuenta como una sola búsqueda para la edad de las
+    entradas de transp, así que las búsquedas de cada respuesta y cada
+    profundidad no hacen viejas a las de las anteriores.
+
+    """
+    if ordena_jugadas is None:
+        ordena_jugadas = jugadas_sin_ordenar
+    if control is None:
+        control = ControlBusqueda()
+    if transp is not None:
+        transp.new_search()
+    if hasattr(ordena_jugadas, 'new_search'):
+        ordena_jugadas.new_search()
+    jugadas = list(ordena_jugadas(juego))
+    for d in range(1, dmax + 1):
+        for jugada in jugadas:
+            juego.hacer_jugada(jugada)
+            try:
+                if juego.terminal() is None:
+                    minimax(juego, d - 1, utilidad, ordena_jugadas, transp,
+                            control, nueva_busqueda=False)
+            except TiempoAgotado:
+                return
+            finally:
+                juego.deshacer_jugada()
+
+
+class BusquedaEnFondo:
+    """
+    Corre buscar(control) en un hilo aparte, para que una interfaz gráfica
+    siga respondiendo mientras la máquina piensa. control es un
+    ControlBusqueda que buscar debe pasarle a la búsqueda (por ejemplo a
+    minimax_t), de manera que detener() la termine con la mejor jugada que
+    lleve. La interfaz revisa de vez en cuando (con after() en tkinter) si
+    ya terminó con lista(), y entonces toma la jugada con jugada().
+
+    """
+    def __init__(self, buscar):
+        self.control = ControlBusqueda()
+        self.inicio = perf_counter()
+        self._resultado = Queue(1)
+        self.hilo = Thread(target=self._corre, args=(buscar,), daemon=True)
+        self.hilo.start()
+
+    def _corre(self, buscar):
+        try:
+            self._resultado.put((buscar(self.control), None))
+        except Exception as error:
+            self._resultado.put((None, error))
+
+    def detener(self):
+        self.control.detener()
+
+    def lista(self):
+        return not self._resultado.empty()
+
+    def transcurrido(self):
+        return perf_counter() - self.inicio
+
+    def jugada(self):
+        """
+        Espera a que termine la búsqueda y regresa su jugada (o vuelve a
+        lanzar la excepción de buscar en este hilo).
+
+        """
+        jugada, error = self._resultado.get()
+        if error is not None:
+            raise error
+        return jugada
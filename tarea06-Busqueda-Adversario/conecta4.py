@@ -11,14 +11,79 @@ es la implementación desde 0 del juego de Otello.
 
 """
 from busquedas_adversarios import JuegoSumaCeros2T
-from busquedas_adversarios import minimax
+from busquedas_adversarios import minimax_t, pondera, BusquedaEnFondo
+from busquedas_adversarios import TiempoAgotado
+from time import perf_counter
+from transposition import TranspositionTable
 from random import shuffle
 import tkinter as tk
 
 __author__ = 'juliowaissman'
 
 
+def lineas_c4():
+    """
+    Regresa las 69 líneas ganadoras del tablero (con la numeración de
+    casillas de ConectaCuatro), cada una como una tupla de 4 casillas.
+
+    """
+    lineas = []
+    for r in range(6):
+        for c in range(7):
+            for dr, dc in ((0, 1), (1, 0), (1, 1), (1, -1)):
+                if 0 <= r + 3 * dr < 6 and 0 <= c + 3 * dc < 7:
+                    lineas.append(tuple(7 * (r + k * dr) + c + k * dc
+                                        for k in range(4)))
+    return lineas
+
+
+LINEAS = lineas_c4()
+
+# Las líneas que pasan por cada casilla
+LINEAS_DE = [tuple(k for k, linea in enumerate(LINEAS) if i in linea)
+             for i in range(42)]
+
+# El estado de una línea es n1 + 5 * n2, con n1 las fichas del jugador 1 y
+# n2 las del jugador -1, así que poner una ficha le suma PASO[ficha]
+PASO = {1: 1, -1: 5}
+
+
+def campo_abiertas(jugador, n):
+    """
+    Las cuentas de líneas abiertas se guardan empacadas en un solo entero,
+    8 bits por cuenta; regresa el desplazamiento de la cuenta de líneas
+    abiertas de jugador con n fichas (n de 1 a 4).
+
+    """
+    return 8 * (n - 1 + (0 if jugador == 1 else 4))
+
+
+def _abiertas_de(estado):
+    # Cuentas empacadas con las que contribuye una línea en estado
+    n1, n2 = estado % 5, estado // 5
+    if n1 and not n2:
+        return 1 << campo_abiertas(1, n1)
+    if n2 and not n1:
+        return 1 << campo_abiertas(-1, n2)
+    return 0
+
+
+# Cambio en las cuentas empacadas al poner (o quitar) una ficha de cada
+# jugador en una línea, según el estado de la línea antes del cambio (los
+# estados imposibles no se usan)
+CAMBIO_PON = {j: [_abiertas_de(e + PASO[j]) - _abiertas_de(e)
+                  for e in range(25)]
+              for j in (1, -1)}
+CAMBIO_QUITA = {j: [_abiertas_de(e - PASO[j]) - _abiertas_de(e)
+                    for e in range(25)]
+                for j in (1, -1)}
+
+
 class ConectaCuatro(JuegoSumaCeros2T):
+    # El reflejo izquierda-derecha del tablero
+    simetrias = ((tuple(7 * (i // 7) + 6 - i % 7 for i in range(42)),
+                  tuple(6 - j for j in range(7))),)
+
     def __init__(self):
         """
         Inicializa el juego, esto es: el número de columnas y
@@ -83,20 +148,196 @@ class ConectaCuatro(JuegoSumaCeros2T):
     def hacer_jugada(self, jugada):
         for i in range(0, 41, 7):
             if self.x[i + jugada] == 0:
-                self.x[i + jugada] = self.jugador
+                self.pon_ficha(i + jugada, self.jugador)
                 self.historial.append(jugada)
-                self.jugador *= -1
+                self.cambia_turno()
                 return None
 
     def deshacer_jugada(self):
         pos = self.historial.pop()
         for i in (35, 28, 21, 14, 7, 0):
             if self.x[i + pos] != 0:
-                self.x[i + pos] = 0
-                self.jugador *= -1
+                self.pon_ficha(i + pos, 0)
+                self.cambia_turno()
                 return None
 
 
+class ConectaCuatroBits(ConectaCuatro):
+    """
+    Conecta 4 con el tablero guardado como dos enteros (bitboards), uno
+    por jugador. Cada columna usa 7 bits (6 renglones más un bit
+    centinela), de manera que el bit de la casilla (renglon, columna)
+    es columna * 7 + renglon:
+
+                         5  12  19  26  33  40  47
+                         4  11  18  25  32  39  46
+                         3  10  17  24  31  38  45
+                         2   9  16  23  30  37  44
+                         1   8  15  22  29  36  43
+                         0   7  14  21  28  35  42
+
+    El bit centinela evita que los corrimientos se "brinquen" de una
+    columna a otra, por lo que revisar si hay 4 en línea se reduce a
+    unas cuantas operaciones de corrimiento e intersección.
+
+    Las jugadas solo modifican los bitboards y el hash de Zobrist (el
+    mismo que el de ConectaCuatro, así que sirven las mismas tablas y
+    libros de aperturas). La lista self.x (con la misma numeración que
+    ConectaCuatro), que usan la interfaz gráfica y algunas funciones de
+    utilidad, se reconstruye de los bitboards solo cuando se lee.
+
+    """
+    def __init__(self):
+        self.fichas = {1: 0, -1: 0}
+        self.altura = [0 for _ in range(7)]
+        super().__init__()
+
+    @property
+    def x(self):
+        if self._x is None:
+            a, b = self.fichas[1], self.fichas[-1]
+            x = [0] * 42
+            for c in range(7):
+                x[c::7] = _COLUMNA[(a >> 7 * c & 63) << 6 | (b >> 7 * c & 63)]
+            self._x = x
+        return self._x
+
+    @x.setter
+    def x(self, valor):
+        self._x = valor
+
+    def jugadas_legales(self):
+        return (j for j in range(7) if self.altura[j] < 6)
+
+    def terminal(self):
+        """
+        Solo el jugador que acaba de tirar puede haber ganado, así que
+        solo se revisa su bitboard en las 4 direcciones (vertical,
+        horizontal y las dos diagonales).
+
+        """
+        if not self.historial:
+            return None
+        b = self.fichas[-self.jugador]
+        for s in (1, 7, 6, 8):
+            m = b & (b >> s)
+            if m & (m >> 2 * s):
+                return -self.jugador
+        if len(self.historial) == 42:
+            return 0
+        return None
+
+    def hacer_jugada(self, jugada):
+        jugador = self.jugador
+        renglon = self.altura[jugada]
+        self.fichas[jugador] |= 1 << (7 * jugada + renglon)
+        self.altura[jugada] = renglon + 1
+        self._cambia_hash(7 * renglon + jugada, jugador)
+        self.historial.append(jugada)
+        self.jugador = -jugador
+        self._x = None
+
+    def deshacer_jugada(self):
+        jugada = self.historial.pop()
+        jugador = self.jugador = -self.jugador
+        renglon = self.altura[jugada] - 1
+        self.altura[jugada] = renglon
+        self.fichas[jugador] ^= 1 << (7 * jugada + renglon)
+        self._cambia_hash(7 * renglon + jugada, jugador)
+        self._x = None
+
+    def _cambia_hash(self, i, jugador):
+        # Poner o quitar la ficha de jugador en la casilla i (con la
+        # numeración de x) y cambiar de turno, sin pasar por pon_ficha
+        z = self.zobrist[jugador][i] ^ self.zobrist_turno
+        self.hash ^= z
+        if self._canonica:
+            hashes = self.hashes_simetricos
+            for k, (casillas, _) in enumerate(self.simetrias):
+                hashes[k] ^= self.zobrist[jugador][casillas[i]] ^ \
+                    self.zobrist_turno
+
+    def pon_ficha(self, i, valor):
+        raise NotImplementedError("ConectaCuatroBits solo cambia el tablero "
+                                  "con hacer_jugada y deshacer_jugada")
+
+
+# Las 6 casillas de una columna (de abajo hacia arriba) en x, para cada
+# pareja de columnas de bits del jugador 1 (a) y del -1 (b), en a << 6 | b
+_COLUMNA = [tuple(1 if a >> r & 1 else -1 if b >> r & 1 else 0
+                  for r in range(6))
+            for a in range(64) for b in range(64)]
+
+
+class LineasAbiertas:
+    """
+    Agrega a un conecta 4 (ConectaCuatro o ConectaCuatroBits) el estado de
+    cada una de las LINEAS y las cuentas empacadas de líneas abiertas (sin
+    fichas del contrario) de cada jugador con 1, 2, 3 y 4 fichas. Se
+    mantienen al poner y quitar fichas, así que utilidad_amenazas no
+    recorre el tablero. Como cuesta en cada jugada, solo lo tienen las
+    clases que lo necesitan (ConectaCuatroLineas y ConectaCuatroBitsLineas).
+
+    """
+    def __init__(self):
+        super().__init__()
+        self.lineas = [0] * len(LINEAS)
+        self.empacadas = 0
+
+    def cambia_lineas(self, i, anterior, valor):
+        """
+        Actualiza las líneas al cambiar la casilla i de anterior a valor.
+
+        """
+        lineas = self.lineas
+        if anterior != 0:
+            cambio, paso = CAMBIO_QUITA[anterior], PASO[anterior]
+            for k in LINEAS_DE[i]:
+                e = lineas[k]
+                self.empacadas += cambio[e]
+                lineas[k] = e - paso
+        if valor != 0:
+            cambio, paso = CAMBIO_PON[valor], PASO[valor]
+            for k in LINEAS_DE[i]:
+                e = lineas[k]
+                self.empacadas += cambio[e]
+                lineas[k] = e + paso
+
+    @property
+    def abiertas(self):
+        """
+        Las cuentas de líneas abiertas desempacadas, como un diccionario
+        con una lista por jugador (abiertas[j][n] para n de 1 a 4, el
+        lugar 0 no se usa).
+
+        """
+        return {j: [0] + [(self.empacadas >> campo_abiertas(j, n)) & 0xff
+                          for n in range(1, 5)]
+                for j in (1, -1)}
+
+
+class ConectaCuatroLineas(LineasAbiertas, ConectaCuatro):
+    def pon_ficha(self, i, valor):
+        anterior = self.x[i]
+        super().pon_ficha(i, valor)
+        self.cambia_lineas(i, anterior, valor)
+
+
+class ConectaCuatroBitsLineas(LineasAbiertas, ConectaCuatroBits):
+    # ConectaCuatroBits no pasa por pon_ficha, así que las líneas se
+    # actualizan con la casilla de la jugada
+    def hacer_jugada(self, jugada):
+        i = 7 * self.altura[jugada] + jugada
+        self.cambia_lineas(i, 0, self.jugador)
+        super().hacer_jugada(jugada)
+
+    def deshacer_jugada(self):
+        jugada = self.historial[-1]
+        i = 7 * (self.altura[jugada] - 1) + jugada
+        self.cambia_lineas(i, -self.jugador, 0)
+        super().deshacer_jugada()
+
+
 def utilidad_c4(juego):
     """
     Calcula la utilidad de una posición del juego conecta 4
@@ -128,6 +369,45 @@ def utilidad_c4(juego):
     return cum / 42
 
 
+def cuenta_abiertas(x):
+    """
+    Calcula desde cero, recorriendo las 69 líneas del tablero x, lo mismo
+    que LineasAbiertas mantiene en abiertas: el número de líneas sin fichas
+    del contrario con 1, 2, 3 y 4 fichas de cada jugador.
+
+    """
+    abiertas = {1: [0] * 5, -1: [0] * 5}
+    for linea in LINEAS:
+        fichas = [x[i] for i in linea]
+        for jugador in (1, -1):
+            if -jugador not in fichas and jugador in fichas:
+                abiertas[jugador][fichas.count(jugador)] += 1
+    return abiertas
+
+
+# Peso de las líneas abiertas con 1, 2 y 3 fichas en utilidad_amenazas,
+# junto con los desplazamientos de sus cuentas para cada jugador
+PESOS_AMENAZAS = (0, 1, 4, 16)
+_CAMPOS_AMENAZAS = tuple((PESOS_AMENAZAS[n], campo_abiertas(1, n),
+                          campo_abiertas(-1, n)) for n in (1, 2, 3))
+
+
+def utilidad_amenazas(juego):
+    """
+    Utilidad para el jugador 1 según las líneas abiertas de cada jugador
+    (las de 3 fichas pesan más que las de 2, y estas más que las de 1),
+    como número entre -1 y 1. Usa las cuentas que mantiene LineasAbiertas
+    (juego tiene que ser, por ejemplo, un ConectaCuatroLineas), así que
+    toma tiempo constante.
+
+    """
+    e = juego.empacadas
+    valor = 0
+    for peso, propias, contrarias in _CAMPOS_AMENAZAS:
+        valor += peso * (((e >> propias) & 0xff) - ((e >> contrarias) & 0xff))
+    return valor / (PESOS_AMENAZAS[3] * len(LINEAS))
+
+
 def ordena_jugadas(juego):
     """
     Ordena las jugadas de acuerdo al jugador actual, en función
@@ -150,14 +430,30 @@ def ordena_jugadas(juego):
 
 
 class Conecta4GUI:
-    def __init__(self, tmax=10, escala=1):
+    def __init__(self, tmax=10, escala=1, tam_tabla=1 << 18, libro=None,
+                 resolvedor=None, desde=24, ponderar=True):
+
+        # Libro de aperturas (opening_book.OpeningBook), si hay
+        self.libro = libro
+
+        # Solucionador exacto (conecta4_solver.Resolvedor), si hay, que se
+        # usa a partir de que se hayan jugado desde fichas (con 24, en
+        # partidas jugadas por minimax, nunca tardó más de 0.2 s; con 18
+        # llegó a tardar 16 s)
+        self.resolvedor = resolvedor
+        self.desde = desde
 
-        # La tabla de transposición
-        self.tr_ta = {}
+        # La tabla de transposición (de tamaño fijo, se reutiliza entre
+        # jugadas y juegos sin crecer)
+        self.tr_ta = TranspositionTable(tam_tabla)
 
         # Máximo tiempo de búsqueda
         self.tmax = tmax
 
+        # Si la máquina piensa (llenando la tabla de transposición) mientras
+        # el humano escoge su jugada
+        self.ponderar = ponderar
+
         self.app = app = tk.Tk()
         self.app.title("Conecta Cuatro")
         self.L = L = int(escala) * 50
@@ -176,6 +472,13 @@ class Conecta4GUI:
         botonN = tk.Button(barra, command=lambda x=False: self.jugar(x),
                            text='(re)iniciar con negras', width=22)
         botonN.grid(column=1, row=0)
+        self.boton_ya = tk.Button(barra, command=self.detener,
+                                  text='¡juega ya!', width=12,
+                                  state=tk.DISABLED)
+        self.boton_ya.grid(column=2, row=0)
+
+        # La búsqueda de la máquina, mientras está pensando
+        self.busqueda = None
 
         ctn = tk.Frame(app, bg='black')
         ctn.pack()
@@ -206,7 +509,11 @@ class Conecta4GUI:
 
     def jugar(self, primero):
 
-        juego = ConectaCuatro()
+        # Si la máquina estaba pensando en el juego anterior, que ya pare
+        if self.busqueda is not None:
+            self.busqueda.detener()
+            self.busqueda.hilo.join()
+        juego = ConectaCuatroLineas()
 
         for i in range(42):
             if self.can[i].val != 0:
@@ -221,9 +528,7 @@ class Conecta4GUI:
             for i in range(7):
                 self.botones[i]['state'] = tk.DISABLED
 
-            jugada = minimax(juego, dmax=6, utilidad=utilidad_c4,
-                             ordena_jugadas=ordena_jugadas,
-                             transp=self.tr_ta)
+            jugada = self.jugada_maquina(juego)
             juego.hacer_jugada(jugada)
             self.actualiza_tablero(jugada, color_p)
 
@@ -233,7 +538,18 @@ class Conecta4GUI:
             for i in juego.jugadas_legales():
                 self.botones[i]['state'] = tk.NORMAL
 
+            if self.ponderar:
+                self.busqueda = BusquedaEnFondo(
+                    lambda control: pondera(juego, utilidad_amenazas,
+                                            ordena_jugadas, self.tr_ta,
+                                            control))
             self.anuncio.master.wait_variable('sel_j')
+            if self.busqueda is not None:
+                # Antes de mover hay que esperar a que el hilo deje el
+                # juego como estaba
+                self.busqueda.detener()
+                self.busqueda.jugada()
+                self.busqueda = None
             jugada = self.sel_j.get()
             juego.hacer_jugada(jugada)
             self.actualiza_tablero(jugada, color)
@@ -248,9 +564,7 @@ class Conecta4GUI:
                 self.botones[i]['state'] = tk.DISABLED
                 self.botones[i].update()
 
-            jugada = minimax(juego, dmax=6, utilidad=utilidad_c4,
-                             ordena_jugadas=ordena_jugadas,
-                             transp=self.tr_ta)
+            jugada = self.jugada_maquina(juego)
             juego.hacer_jugada(jugada)
             self.actualiza_tablero(jugada, color_p)
 
@@ -266,6 +580,55 @@ class Conecta4GUI:
                    "Un asqueroso empate")
         self.anuncio['text'] = str_fin
 
+    def jugada_maquina(self, juego):
+        """
+        Busca la jugada de la máquina en otro hilo (con busca), mientras
+        la ventana sigue respondiendo y muestra cuánto lleva pensando. El
+        botón de juega ya termina la búsqueda con la mejor jugada que lleve.
+
+        """
+        self.busqueda = busqueda = BusquedaEnFondo(
+            lambda control: self.busca(juego, control))
+        self.boton_ya['state'] = tk.NORMAL
+        terminada = tk.BooleanVar(self.app, False)
+
+        def revisa():
+            if busqueda.lista():
+                terminada.set(True)
+                return
+            self.anuncio['text'] = "Ahora juega Python ({:.0f} s)".format(
+                busqueda.transcurrido())
+            self.app.after(100, revisa)
+
+        self.app.after(100, revisa)
+        self.app.wait_variable(terminada)
+        self.boton_ya['state'] = tk.DISABLED
+        self.busqueda = None
+        return busqueda.jugada()
+
+    def detener(self):
+        if self.busqueda is not None:
+            self.busqueda.detener()
+
+    def busca(self, juego, control):
+        if self.libro is not None:
+            jugada = self.libro.move_for(juego)
+            if jugada is not None:
+                return jugada
+        tmax = self.tmax
+        if (self.resolvedor is not None and
+                len(juego.historial) >= self.desde):
+            # El resolvedor tiene la mitad del tiempo; si no le alcanza (o
+            # se pidió que juegue ya) se busca con minimax_t el resto
+            tmax /= 2
+            control.limite = perf_counter() + tmax
+            try:
+                return self.resolvedor(juego, control=control)
+            except TiempoAgotado:
+                pass
+        return minimax_t(juego, tmax, utilidad_amenazas, ordena_jugadas,
+                         transp=self.tr_ta, control=control).jugada
+
     def actualiza_tablero(self, fila, color):
         for i in range(0, 41, 7):
             if self.can[i + fila].val == 0:
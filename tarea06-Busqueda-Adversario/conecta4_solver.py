@@ -0,0 +1,235 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+conecta4_solver.py
+------------------
+
+Solucionador exacto (juego perfecto) del conecta 4 en el tablero
+estándar de 7 x 6, siguiendo las ideas del solucionador de Pascal Pons:
+
+1. El tablero son dos enteros: las fichas del jugador en turno y la
+   máscara de casillas ocupadas, con la misma numeración de bits que
+   conecta4.ConectaCuatroBits (columna * 7 + renglon).
+
+2. Negamax con poda alfa-beta sobre el valor teórico del juego: si el
+   jugador en turno gana, el valor es el número de fichas que le quedan
+   sin jugar al ganar (más alto mientras más rápido gane), negativo si
+   pierde y 0 si es empate.
+
+3. Las jugadas se ordenan empezando por el centro, y antes que nada por
+   el número de amenazas (casillas donde se completaría un 4 en línea)
+   que dejan.
+
+4. Se anticipan las jugadas perdedoras: nunca se juega debajo de una
+   casilla donde el contrario gana, y si el contrario tiene dos amenazas
+   inmediatas la posición ya está perdida.
+
+5. La tabla de transposición guarda cotas superiores del valor.
+
+6. El valor exacto se obtiene con búsquedas de ventana nula, partiendo a
+   la mitad el intervalo de valores posibles (búsqueda binaria).
+
+Se puede usar desde la interfaz (Conecta4GUI(resolvedor=Resolvedor()))
+o desde la línea de comandos, con las columnas jugadas (de 0 a 6), y -d
+para calcular solo si cada jugada gana, empata o pierde:
+
+    python conecta4_solver.py 3332
+    python conecta4_solver.py -d 33224411005566
+"""
+
+from transposition import TranspositionTable
+from bitboard import popcount
+import sys
+
+__author__ = 'Rafael Castillo'
+
+ANCHO, ALTO = 7, 6
+CASILLAS = ANCHO * ALTO
+ABAJO = sum(1 << (7 * c) for c in range(ANCHO))
+TABLERO = ABAJO * ((1 << ALTO) - 1)
+ORDEN_COLUMNAS = (3, 2, 4, 1, 5, 0, 6)
+
+
+def columna(c):
+    return ((1 << ALTO) - 1) << (7 * c)
+
+
+# Máscaras de las columnas en el orden en que se prueban
+COLUMNAS = tuple(columna(c) for c in ORDEN_COLUMNAS)
+
+
+def arriba(c):
+    return 1 << (ALTO - 1 + 7 * c)
+
+
+def posiciones_ganadoras(propias, mascara):
+    """
+    Regresa las casillas vacías donde propias completaría un 4 en línea.
+
+    """
+    # Vertical
+    r = (propias << 1) & (propias << 2) & (propias << 3)
+    # Horizontal y diagonales
+    for s in (7, 6, 8):
+        p = (propias << s) & (propias << 2 * s)
+        r |= p & (propias << 3 * s)
+        r |= p & (propias >> s)
+        p = (propias >> s) & (propias >> 2 * s)
+        r |= p & (propias << s)
+        r |= p & (propias >> 3 * s)
+    return r & (TABLERO ^ mascara)
+
+
+def posibles(mascara):
+    return (mascara + ABAJO) & TABLERO
+
+
+class Resolvedor:
+    def __init__(self, tam_tabla=1 << 20):
+        self.tabla = TranspositionTable(tam_tabla)
+        self.nodos = 0
+
+    @staticmethod
+    def posicion(juego):
+        """
+        Convierte un juego de conecta4 (ConectaCuatro o ConectaCuatroBits)
+        en la tupla (propias, mascara, jugadas) del jugador en turno.
+
+        """
+        propias, mascara = 0, 0
+        for jugada in juego.historial:
+            propias ^= mascara
+            mascara |= mascara + (1 << (7 * jugada))
+        return propias, mascara, len(juego.historial)
+
+    def negamax(self, propias, mascara, n, alfa, beta, control=None):
+        self.nodos += 1
+        if control is not None:
+            control.visita()
+        contrario = propias ^ mascara
+        jugables = posibles(mascara)
+        amenazas = posiciones_ganadoras(contrario, mascara)
+        forzadas = jugables & amenazas
+        if forzadas:
+            if forzadas & (forzadas - 1):
+                # Dos amenazas del contrario, no se pueden tapar ambas
+                return -((CASILLAS - n) // 2)
+            jugables = forzadas
+        siguientes = jugables & ~(amenazas >> 1)
+        if not siguientes:
+            return -((CASILLAS - n) // 2)
+        if n >= CASILLAS - 2:
+            return 0
+
+        minimo = -((CASILLAS - 2 - n) // 2)
+        if alfa < minimo:
+            alfa = minimo
+            if alfa >= beta:
+                return alfa
+        maximo = (CASILLAS - 1 - n) // 2
+        cota = self.tabla.probe(propias + mascara)
+        if cota is not None:
+            maximo = cota
+        if beta > maximo:
+            beta = maximo
+            if alfa >= beta:
+                return beta
+
+        jugadas = []
+        for col in COLUMNAS:
+            jugada = siguientes & col
+            if jugada:
+                valor = popcount(posiciones_ganadoras(propias | jugada,
+                                                      mascara))
+                jugadas.append((-valor, len(jugadas), jugada))
+        jugadas.sort()
+
+        for _, _, jugada in jugadas:
+            valor = -self.negamax(contrario, mascara | jugada, n + 1,
+                                  -beta, -alfa, control)
+            if valor >= beta:
+                return valor
+            if valor > alfa:
+                alfa = valor
+        # Con la profundidad que falta, la casilla de la cubeta que prefiere
+        # profundidad se queda con las posiciones más cercanas a la raíz
+        self.tabla.store(propias + mascara, CASILLAS - n, alfa)
+        return alfa
+
+    def valor(self, propias, mascara, n, debil=False, control=None):
+        """
+        Valor exacto de la posición para el jugador en turno. Si debil es
+        verdadero solo se calcula su signo (gana, empata o pierde).
+
+        Si control (un busquedas_adversarios.ControlBusqueda) no es None, se
+        le avisa de cada nodo, así que la búsqueda se interrumpe con
+        TiempoAgotado si se pasa su límite o si se llama control.detener().
+
+        """
+        if posibles(mascara) & posiciones_ganadoras(propias, mascara):
+            return 1 if debil else (CASILLAS + 1 - n) // 2
+        minimo, maximo = -((CASILLAS - n) // 2), (CASILLAS + 1 - n) // 2
+        if debil:
+            minimo, maximo = -1, 1
+        while minimo < maximo:
+            medio = minimo + (maximo - minimo) // 2
+            if medio <= 0 and int(minimo / 2) < medio:
+                medio = int(minimo / 2)
+            elif medio >= 0 and int(maximo / 2) > medio:
+                medio = int(maximo / 2)
+            r = self.negamax(propias, mascara, n, medio, medio + 1, control)
+            if debil:
+                # negamax puede regresar cotas fuera de la ventana
+                r = max(-1, min(1, r))
+            if r <= medio:
+                maximo = r
+            else:
+                minimo = r
+        return minimo
+
+    def valores(self, juego, debil=False, control=None):
+        """
+        Regresa un diccionario con el valor exacto de cada jugada legal de
+        juego, para el jugador en turno (control como en valor).
+
+        """
+        propias, mascara, n = self.posicion(juego)
+        resultado = {}
+        for c in ORDEN_COLUMNAS:
+            if mascara & arriba(c):
+                continue
+            jugada = (mascara + (1 << (7 * c))) & columna(c)
+            if posiciones_ganadoras(propias, mascara) & jugada:
+                resultado[c] = 1 if debil else (CASILLAS + 1 - n) // 2
+            else:
+                resultado[c] = -self.valor(propias ^ mascara,
+                                           mascara | jugada, n + 1, debil,
+                                           control)
+        return resultado
+
+    def __call__(self, juego, debil=True, control=None):
+        """
+        Regresa la mejor jugada de juego (la de mayor valor, y entre
+        empates la más cercana al centro). Por omisión solo se distingue
+        entre ganar, empatar y perder, que es mucho más rápido y basta para
+        jugar perfecto.
+
+        """
+        valores = self.valores(juego, debil, control)
+        return max(valores, key=valores.get)
+
+
+if __name__ == '__main__':
+    from conecta4 import ConectaCuatroBits
+    from time import perf_counter
+
+    debil = '-d' in sys.argv
+    for jugadas in [arg for arg in sys.argv[1:] if arg != '-d'] or ['']:
+        juego = ConectaCuatroBits()
+        for jugada in jugadas:
+            juego.hacer_jugada(int(jugada))
+        resolvedor = Resolvedor()
+        t0 = perf_counter()
+        valores = resolvedor.valores(juego, debil)
+        print("{}: {} ({} nodos, {:.3f} s)".format(
+            jugadas, valores, resolvedor.nodos, perf_counter() - t0))
@@ -0,0 +1,231 @@
+"""
+endgame.py
+----------
+
+Solucionador exacto de finales de otelo. Cuando quedan pocas casillas
+vacías se puede buscar hasta el final del juego, y el valor que se
+obtiene (la diferencia final de fichas) es exacto, no una estimación de
+una función de utilidad.
+
+El solucionador trabaja directamente con bitboards (ver bitboard.py) y
+ordena las jugadas con:
+
+* Paridad de regiones: se prefieren las casillas de los cuadrantes con un
+  número impar de casillas vacías (así el jugador tiende a quedarse con la
+  última jugada de cada región).
+
+* Primero la más rápida (fastest first): con suficientes casillas vacías,
+  se prefieren las jugadas que le dejan menos jugadas al contrario.
+
+* La mejor jugada guardada en la tabla de transposición, que también
+  guarda cotas del valor de las posiciones con muchas casillas vacías.
+
+En modo 'wld' solo se averigua si la posición se gana, empata o pierde
+(búsqueda con ventana (-1, 1)), lo cual es bastante más rápido que el
+valor exacto; por omisión se resuelven exactas las posiciones con hasta 12
+casillas vacías y con 13 o 14 solo en modo 'wld' (cada una toma unos pocos
+segundos en Python).
+
+Como eso puede ser más de lo que hay para una jugada, solve recibe una
+función check que se llama cada CHECK_EVERY nodos y que puede interrumpir
+la búsqueda lanzando una excepción (games.Negamax usa SearchTimeout).
+"""
+
+from bitboard import FULL, moves_mask, flips, popcount, iter_squares
+from transposition import TranspositionTable
+
+__author__ = 'Rafael Castillo'
+
+# Máscaras de los cuatro cuadrantes de 4x4, y el cuadrante de cada casilla
+QUADRANTS = (0x000000000f0f0f0f, 0x00000000f0f0f0f0,
+             0x0f0f0f0f00000000, 0xf0f0f0f000000000)
+QUADRANT_OF = tuple(next(q for q in QUADRANTS if q >> sq & 1)
+                    for sq in range(64))
+
+# Abajo de esta cantidad de vacías no vale la pena calcular la movilidad
+# del contrario para ordenar, basta con la paridad
+FASTEST_FIRST_EMPTIES = 7
+
+# Solo se usa la tabla de transposición con al menos estas casillas vacías;
+# más abajo cuesta más consultarla que volver a buscar
+TT_EMPTIES = 8
+
+# Cada cuántos nodos se llama check
+CHECK_EVERY = 1024
+
+
+def final_score(own, opp):
+    '''
+    Diferencia final de fichas para own; las casillas vacías se las lleva
+    el que gana.
+    '''
+    diff = popcount(own) - popcount(opp)
+    empties = 64 - popcount(own | opp)
+    return diff + empties if diff > 0 else diff - empties if diff < 0 else 0
+
+
+class EndgameSolver:
+    def __init__(self, empties=14, exact_empties=12):
+        '''
+        Resuelve las posiciones con a lo más empties casillas vacías: en modo
+        'exact' (diferencia final de fichas) si tienen a lo más
+        exact_empties, y en modo 'wld' (solo el signo) si tienen más.
+        '''
+        self.empties = empties
+        self.exact_empties = exact_empties
+        self.nodes = 0
+        self.trans_table = TranspositionTable(1 << 18)
+        self.check = None
+        self.next_check = 0
+
+    def n_empties(self, pos):
+        own, opp = self._bits(pos)
+        return 64 - popcount(own | opp)
+
+    def applies(self, pos):
+        return self.n_empties(pos) <= self.empties
+
+    def __call__(self, pos, check=None):
+        '''
+        Regresa la mejor jugada de pos si tiene pocas casillas vacías, o None
+        si hay que buscarla de otra manera.
+        '''
+        if not self.applies(pos):
+            return None
+        return self.solve(pos, check=check)[1]
+
+    def solve(self, pos, mode=None, check=None):
+        '''
+        Regresa (valor, jugada) de pos para el jugador en turno. El valor es
+        la diferencia final de fichas, o solo su signo en modo 'wld'. Si mode
+        es None se escoge según el número de casillas vacías.
+
+        Si check no es None se llama cada CHECK_EVERY nodos; si lanza una
+        excepción, la búsqueda se interrumpe con esa excepción.
+        '''
+        if mode is None:
+            mode = ('exact' if self.n_empties(pos) <= self.exact_empties
+                    else 'wld')
+        own, opp = self._bits(pos)
+        self.trans_table.new_search()
+        self.check = check
+        self.next_check = self.nodes + CHECK_EVERY
+        alpha, beta = (-1, 1) if mode == 'wld' else (-64, 64)
+        moves = moves_mask(own, opp)
+        if not moves:
+            if not moves_mask(opp, own):
+                best_score, best_move = final_score(own, opp), None
+            else:
+                best_score = -self._search(opp, own, -beta, -alpha)
+                best_move = 'pass'
+            if mode == 'wld':
+                best_score = (best_score > 0) - (best_score < 0)
+            return best_score, best_move
+
+        best_score, best_move = -65, None
+        for i, sq in enumerate(self._order(own, opp, moves)):
+            bit = 1 << sq
+            flipped = flips(own, opp, bit)
+            new_own, new_opp = opp ^ flipped, own | bit | flipped
+            if i:
+                score = -self._search(new_own, new_opp, -alpha - 1, -alpha)
+                if alpha < score < beta:
+                    score = -self._search(new_own, new_opp, -beta, -alpha)
+            else:
+                score = -self._search(new_own, new_opp, -beta, -alpha)
+            if score > best_score:
+                best_score, best_move = score, divmod(sq, 8)
+                alpha = max(alpha, score)
+                if alpha >= beta:
+                    break
+        if mode == 'wld':
+            best_score = (best_score > 0) - (best_score < 0)
+        return best_score, best_move
+
+    @staticmethod
+    def _bits(pos):
+        if hasattr(pos, 'white'):
+            white, black = pos.white, pos.black
+        else:
+            from othello import array_to_bits
+            white, black = array_to_bits(pos.board)
+        return (white, black) if pos.player == 1 else (black, white)
+
+    def _order(self, own, opp, moves, first=None):
+        empties = FULL ^ (own | opp)
+        squares = list(iter_squares(moves))
+        if len(squares) < 2:
+            return squares
+        if first is not None:
+            squares.remove(first)
+            return [first] + self._order(own, opp, moves ^ (1 << first))
+
+        def parity(sq):
+            return popcount(empties & QUADRANT_OF[sq]) & 1
+
+        if popcount(empties) <= FASTEST_FIRST_EMPTIES:
+            squares.sort(key=parity, reverse=True)
+            return squares
+
+        def mobility(sq):
+            bit = 1 << sq
+            flipped = flips(own, opp, bit)
+            reply = moves_mask(opp ^ flipped, own | bit | flipped)
+            return 2 * popcount(reply) - parity(sq)
+
+        squares.sort(key=mobility)
+        return squares
+
+    def _search(self, own, opp, alpha, beta):
+        '''
+        Negamax alfa-beta (fail-soft) hasta el final del juego, con ventanas
+        nulas para todas las jugadas menos la primera.
+        '''
+        self.nodes += 1
+        if self.nodes >= self.next_check and self.check is not None:
+            self.next_check = self.nodes + CHECK_EVERY
+            self.check()
+        moves = moves_mask(own, opp)
+        if not moves:
+            if not moves_mask(opp, own):
+                return final_score(own, opp)
+            return -self._search(opp, own, -beta, -alpha)
+
+        entry = None
+        use_tt = 64 - popcount(own | opp) >= TT_EMPTIES
+        if use_tt:
+            entry = self.trans_table.probe((own, opp))
+            if entry is not None:
+                lower, upper, _ = entry
+                if lower >= beta:
+                    return lower
+                if upper <= alpha or lower == upper:
+                    return upper
+                alpha, beta = max(alpha, lower), min(beta, upper)
+        original_alpha = alpha
+
+        best, best_sq = -65, None
+        for i, sq in enumerate(self._order(own, opp, moves,
+                                           entry and entry[2])):
+            bit = 1 << sq
+            flipped = flips(own, opp, bit)
+            new_own, new_opp = opp ^ flipped, own | bit | flipped
+            if i:
+                score = -self._search(new_own, new_opp, -alpha - 1, -alpha)
+                if alpha < score < beta:
+                    score = -self._search(new_own, new_opp, -beta, -alpha)
+            else:
+                score = -self._search(new_own, new_opp, -beta, -alpha)
+            if score > best:
+                best, best_sq = score, sq
+                if score > alpha:
+                    alpha = score
+                    if alpha >= beta:
+                        break
+
+        if use_tt:
+            self.trans_table.store(
+                (own, opp), 64 - popcount(own | opp),
+                (best if best > original_alpha else -64,
+                 best if best < beta else 64, best_sq))
+        return best
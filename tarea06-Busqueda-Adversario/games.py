@@ -1,5 +1,11 @@
 from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
+from threading import Thread
 from time import perf_counter
+from time_manager import SearchTimeout
+from transposition import TranspositionTable, SharedTranspositionTable
+from transposition import PackedTranspositionTable
+import os
 import random
 
 
@@ -41,6 +47,44 @@ class Position(namedtuple('Position', ['board', 'player'])):
                                   '__default_state__ method')
 
 
+class MutablePosition:
+    '''
+    Variante mutable de Position: en lugar de crear una posición nueva por
+    cada jugada, make(move) modifica la posición y guarda en una pila lo
+    necesario para que unmake() la regrese a como estaba. Sigue teniendo
+    player, terminal, legal_moves, hashable_pos() y make_move() (que
+    regresa una posición inmutable), así que las funciones de utilidad y
+    de ordenamiento no cambian.
+
+    Para buscarla con MutableNegamax, además las jugadas se pueden manejar
+    como enteros: move_mask() regresa las jugadas del jugador en turno
+    como una máscara de bits (la jugada k es el bit k, y si no hay ninguna
+    la única jugada es PASS), make_square(k) hace la jugada k y key() es
+    una llave entera de la posición para la tabla de transposición.
+    '''
+    PASS = None
+
+    def make(self, move):
+        raise NotImplementedError('Game class must implement '
+                                  'the make method')
+
+    def unmake(self):
+        raise NotImplementedError('Game class must implement '
+                                  'the unmake method')
+
+    def move_mask(self):
+        raise NotImplementedError('Game class must implement '
+                                  'the move_mask method')
+
+    def make_square(self, square):
+        raise NotImplementedError('Game class must implement '
+                                  'the make_square method')
+
+    def key(self):
+        raise NotImplementedError('Game class must implement '
+                                  'the key method')
+
+
 inf = float('infinity')
 
 TransTableEntry = namedtuple('TransTableEntry',
@@ -48,7 +92,67 @@ TransTableEntry = namedtuple('TransTableEntry',
 
 
 class Negamax:
-    def __init__(self, utility=None, order_moves=None, max_depth=10):
+    '''
+    Negamax con poda alfa-beta, tabla de transposición y profundización
+    iterativa.
+
+    Si pvs es verdadero se usa Principal Variation Search: solo la primera
+    jugada de cada nodo se busca con la ventana completa, y el resto con
+    una ventana nula que solo dice si la jugada es mejor o no; si resulta
+    mejor se vuelve a buscar con la ventana completa.
+
+    Si aspiration no es None, cada iteración de la profundización iterativa
+    empieza con una ventana de ese radio alrededor del valor de la
+    iteración anterior, y solo si el valor cae fuera se amplía.
+
+    Si book (un opening_book.OpeningBook) no es None, las posiciones que
+    estén en el libro se contestan con la jugada del libro sin buscar.
+
+    Si canonical es verdadero, la llave de la tabla de transposición es la
+    menor entre las simetrías de la posición (pos.canonical_pos(), ver
+    othello.ReversiPosition), así que las posiciones simétricas comparten
+    entrada; las jugadas guardadas se traducen de y hacia esa simetría con
+    pos.transform_move.
+
+    Si batch_utility no es None, se usa en la frontera (profundidad 1): las
+    posiciones hijas se evalúan todas juntas con una sola llamada a
+    batch_utility(posiciones), que regresa la utilidad de cada una (ver
+    othello.batch_hybrid_utility), en lugar de llamar utility una por una.
+
+    Si endgame no es None, se llama endgame(pos, check) antes de buscar; si
+    regresa una jugada (por ejemplo endgame.EndgameSolver cuando quedan
+    pocas casillas vacías) esa es la que se juega. endgame debe llamar
+    check() de vez en cuando, que lanza SearchTimeout al pasar la mitad del
+    tiempo de la jugada o si se pidió stop(); entonces se busca como
+    siempre con el tiempo que queda.
+
+    Después de cada llamada, depth_nodes tiene los nodos visitados en cada
+    profundidad, como una lista de parejas (profundidad, nodos).
+
+    Si time_manager (un time_manager.TimeManager) no es None, la búsqueda
+    tiene una fecha límite dura: cada time_manager.check_every nodos se
+    revisa el reloj, y si se pasó se interrumpe la iteración en curso y se
+    regresa la mejor jugada que esta alcanzó a encontrar en la raíz (o la de
+    la iteración anterior). El tiempo de cada jugada es max_time, o si se
+    da remaining (lo que le queda al jugador en el reloj), el presupuesto
+    que calcule time_manager.allocate para esa fase del juego.
+
+    Si a la llamada se le pasa stats (un search_stats.SearchStats), la
+    búsqueda lo llena con los nodos, los cortes, el uso de la tabla de
+    transposición y una entrada por iteración, y se regresa la pareja
+    (jugada, stats) en lugar de solo la jugada.
+    '''
+    # Ancho de la ventana nula de PVS (los valores no son enteros)
+    NULL_WINDOW = 1e-9
+
+    # Cada cuántos nodos se revisa si se pidió stop() cuando se está
+    # pensando en el tiempo del contrario (ponder)
+    CHECK_EVERY = 256
+
+    def __init__(self, utility=None, order_moves=None, max_depth=10,
+                 tt_size=1 << 20, pvs=False, aspiration=None, book=None,
+                 endgame=None, canonical=False, batch_utility=None,
+                 time_manager=None):
         if utility is None:
             def utility(pos):
                 return pos.terminal
@@ -60,35 +164,161 @@ class Negamax:
 
         self.utility = utility
         self.order_moves = order_moves
-        self.max_depth = 10
+        self.max_depth = max_depth
+        self.trans_table = TranspositionTable(tt_size)
+        self.pvs = pvs
+        self.aspiration = aspiration
+        self.book = book
+        self.endgame = endgame
+        self.canonical = canonical
+        self.batch_utility = batch_utility
+        self.time_manager = time_manager
+        self.nodes = 0
+        self.depth_nodes = []
+        self.stats = None
+        # Nodo en el que toca revisar el reloj, y mejor jugada de la raíz
+        # en la iteración en curso
+        self.next_check = inf
+        self.root_depth = None
+        self.partial = None
+        self.stopped = False
+
+    def __call__(self, pos, max_time=10, stats=None, remaining=None):
+        if stats is None:
+            return self.choose(pos, max_time, remaining)
+        self.stats = stats
+        try:
+            return self.choose(pos, max_time, remaining), stats
+        finally:
+            self.stats = None
+
+    def choose(self, pos, max_time, remaining=None):
+        if self.book is not None:
+            move = self.book.move_for(pos)
+            if move is not None and move in pos.legal_moves:
+                return move
+
+        tm = self.time_manager
+        if tm is not None and remaining is not None:
+            max_time = tm.allocate(pos, remaining)
+        if self.endgame is not None:
+            start_time = perf_counter()
+            move = self.solve_endgame(pos, start_time + max_time / 2)
+            if move is not None:
+                return move
+            max_time = max(max_time - (perf_counter() - start_time), 0.0)
+
+        if tm is not None:
+            tm.start(max_time)
+            self.next_check = self.nodes + tm.check_every
 
-    def __call__(self, pos, max_time=10):
         branching_factor = len(list(pos.legal_moves))
-        self.trans_table = {}
+        self.trans_table.new_search()
+        if hasattr(self.order_moves, 'new_search'):
+            self.order_moves.new_search()
         start_time = perf_counter()
-        for depth in range(2, self.max_depth):
-            local_start = perf_counter()
-            score, move = self.nega_run(pos, depth, -inf, inf, pos.player)
-            local_end = perf_counter()
+        self.depth_nodes = []
+        score = move = None
+        try:
+            for depth in range(2, self.max_depth):
+                local_start = perf_counter()
+                nodes = self.nodes
+                if self.stats is not None:
+                    self.stats.start_iteration(depth)
+                try:
+                    score, move = self.search_depth(pos, depth, score)
+                except SearchTimeout:
+                    if self.stats is not None:
+                        self.stats.end_iteration(completed=False)
+                    if self.partial is not None:
+                        move = self.partial
+                    break
+                if self.stats is not None:
+                    self.stats.end_iteration()
+                self.depth_nodes.append((depth, self.nodes - nodes))
+                local_end = perf_counter()
 
-            if (branching_factor * (local_end - local_start) >
-                    start_time + max_time - local_end):
+                if (branching_factor * (local_end - local_start) >
+                        start_time + max_time - local_end):
+                    break
+        finally:
+            if tm is not None:
+                tm.finish()
+                self.next_check = inf
 
-                return move
+        if move is None:
+            # Ni la primera iteración alcanzó a encontrar una jugada
+            move = next(iter(pos.legal_moves))
         return move
 
+    def solve_endgame(self, pos, deadline):
+        '''
+        La jugada que da self.endgame para pos, o None si no la da o si no
+        terminó antes de deadline (o de que se pidiera stop()).
+        '''
+        def check():
+            if self.stopped or perf_counter() > deadline:
+                raise SearchTimeout()
+
+        try:
+            return self.endgame(pos, check)
+        except SearchTimeout:
+            return None
+
+    def search_depth(self, pos, depth, guess=None):
+        '''
+        Busca pos a profundidad depth, con ventana de aspiración alrededor
+        de guess (el valor de la iteración anterior) si se pidió.
+        '''
+        self.root_depth = depth
+        self.partial = None
+        if guess is None or self.aspiration is None:
+            return self.nega_run(pos, depth, -inf, inf, pos.player)
+
+        alpha, beta = guess - self.aspiration, guess + self.aspiration
+        while True:
+            score, move = self.nega_run(pos, depth, alpha, beta, pos.player)
+            if score <= alpha:
+                alpha = -inf
+            elif score >= beta:
+                beta = inf
+            else:
+                return score, move
+
+    def tt_key(self, pos):
+        '''
+        Regresa la llave de pos en la tabla de transposición y la simetría
+        con la que hay que traducir las jugadas (None si no hay que hacerlo).
+        '''
+        if not self.canonical:
+            return pos.hashable_pos(), None
+        key, symmetry = pos.canonical_pos()
+        return key, symmetry or None
+
     def nega_run(self, pos, depth, alpha, beta, player):
+        self.nodes += 1
+        if self.nodes >= self.next_check:
+            self.check_time()
+        stats = self.stats
         original_alpha = alpha
 
-        entry = self.trans_table.get(pos.hashable_pos())
+        key, symmetry = self.tt_key(pos)
+        entry = self.trans_table.probe(key)
+        if stats is not None:
+            stats.nodes += 1
+            stats.tt_probes += 1
+            stats.tt_hits += entry is not None
+        if entry is not None and symmetry is not None:
+            entry = entry._replace(move=pos.transform_move(
+                entry.move, symmetry, inverse=True))
         if entry is not None and entry.depth >= depth:
-            if entry.flag == 'exact':
-                return entry.value, entry.move
             if entry.flag == 'lower_bound':
                 alpha = max(alpha, entry.value)
             elif entry.flag == 'upper_bound':
                 beta = min(beta, entry.value)
-            if alpha >= beta:
+            if entry.flag == 'exact' or alpha >= beta:
+                if stats is not None:
+                    stats.tt_cutoffs += 1
                 return entry.value, entry.move
 
         if depth == 0 or pos.terminal:
@@ -99,12 +329,37 @@ class Negamax:
             moves.remove(entry.move)
             moves.insert(0, entry.move)
 
+        leaf_values = None
+        if depth == 1 and self.batch_utility is not None:
+            leaf_values = self.batch_utility([pos.make_move(move)
+                                              for move in moves])
+
         best_score = -inf
         best_move = None
-        for move in moves:
-            new_pos = pos.make_move(move)
-            v, m = self.nega_run(new_pos, depth-1, -beta, -alpha, -player)
-            v = -v
+        for i, move in enumerate(moves):
+            if leaf_values is not None:
+                # Lo mismo que regresaría nega_run en la hoja, negado
+                self.nodes += 1
+                if stats is not None:
+                    stats.nodes += 1
+                v = player * leaf_values[i]
+            elif self.pvs and i:
+                new_pos = self.play(pos, move)
+                v, m = self.nega_run(new_pos, depth-1,
+                                     -alpha - self.NULL_WINDOW, -alpha,
+                                     -player)
+                v = -v
+                if alpha < v < beta:
+                    v, m = self.nega_run(new_pos, depth-1, -beta, -alpha,
+                                         -player)
+                    v = -v
+                self.undo(pos)
+            else:
+                new_pos = self.play(pos, move)
+                v, m = self.nega_run(new_pos, depth-1, -beta, -alpha,
+                                     -player)
+                v = -v
+                self.undo(pos)
 
             if best_score < v:
                 best_score = v
@@ -112,13 +367,378 @@ class Negamax:
 
             if alpha < v:
                 alpha = v
-                if alpha > beta:
+                if depth == self.root_depth:
+                    self.partial = move
+                if alpha >= beta:
+                    if hasattr(self.order_moves, 'cutoff'):
+                        self.order_moves.cutoff(pos, move, depth)
+                    if stats is not None:
+                        stats.cutoffs += 1
+                        stats.first_move_cutoffs += i == 0
                     break
 
         flag = ('upper_bound' if best_score <= original_alpha else
                 'lower_bound' if best_score >= beta else 'exact')
 
-        entry = TransTableEntry(flag, depth, best_score, best_move)
-        self.trans_table[pos.hashable_pos()] = entry
+        stored_move = (best_move if symmetry is None else
+                       pos.transform_move(best_move, symmetry))
+        entry = TransTableEntry(flag, depth, best_score, stored_move)
+        self.trans_table.store(key, depth, entry)
 
         return best_score, best_move
+
+    def check_time(self):
+        '''
+        Se llama cada tantos nodos mientras hay un límite de tiempo o se
+        está pensando en el tiempo del contrario; lanza SearchTimeout si se
+        pasó la fecha límite o si se pidió stop().
+        '''
+        if self.stopped:
+            raise SearchTimeout()
+        tm = self.time_manager
+        if tm is not None and tm.deadline is not None:
+            self.next_check = self.nodes + tm.check_every
+            tm.check()
+        else:
+            self.next_check = self.nodes + self.CHECK_EVERY
+
+    def ponder(self, pos):
+        '''
+        Piensa en el tiempo del contrario: con pos en el turno del
+        contrario, busca con profundización iterativa la posición después
+        de cada una de sus jugadas (primero la que dice la tabla, luego en
+        el orden de order_moves), llenando la tabla de transposición hasta
+        que otro hilo llame stop(). Al llegar la jugada del contrario, la
+        búsqueda de la respuesta encuentra ya en la tabla lo que se buscó
+        de esa posición. Ver Ponderer.
+        '''
+        replies = list(self.order_moves(pos))
+        expected = self.tt_move(pos)
+        if expected is not None and expected in replies:
+            replies.remove(expected)
+            replies.insert(0, expected)
+
+        self.trans_table.new_search()
+        self.next_check = self.nodes
+        try:
+            for depth in range(1, self.max_depth):
+                for move in replies:
+                    child = pos.make_move(move)
+                    if not child.terminal:
+                        self.search_depth(child, depth)
+        except SearchTimeout:
+            pass
+        finally:
+            self.next_check = inf
+
+    def stop(self):
+        self.stopped = True
+
+    def tt_move(self, pos):
+        '''
+        La mejor jugada de pos guardada en la tabla de transposición, o None.
+        '''
+        key, symmetry = self.tt_key(pos)
+        entry = self.trans_table.probe(key)
+        if entry is None or entry.move is None:
+            return None
+        return (entry.move if symmetry is None else
+                pos.transform_move(entry.move, symmetry, inverse=True))
+
+    def play(self, pos, move):
+        '''
+        Regresa la posición después de jugar move en pos.
+        '''
+        return pos.make_move(move)
+
+    def undo(self, pos):
+        '''
+        Regresa pos a como estaba antes de play (aquí no hace falta, pues
+        play no la modifica).
+        '''
+
+
+class MutableNegamax(Negamax):
+    '''
+    Negamax sobre posiciones mutables (MutablePosition) que no crea objetos
+    por nodo: cada nodo hace la jugada en la misma posición con
+    make_square y la deshace con unmake, las jugadas se recorren como
+    índices de bits directamente de move_mask(), la llave de la tabla es
+    el entero key() y la tabla (PackedTranspositionTable) guarda el valor y
+    un entero con la jugada y la bandera.
+
+    En lugar de order_moves, el orden lo dan las máscaras de move_groups
+    (un diccionario con una tupla de máscaras por jugador, por ejemplo
+    othello.SIMPLE_ORDER_GROUPS): primero se prueba la jugada de la tabla,
+    luego las de cada máscara en orden, y dentro de cada máscara de la
+    casilla menor a la mayor. Por omisión todas de la menor a la mayor.
+    Para que las hojas tampoco creen objetos, la utilidad debe leer la
+    posición sin armar tableros (por ejemplo othello.bit_hybrid_utility).
+
+    to_mutable convierte la posición que se le da a la búsqueda en una
+    posición mutable (por ejemplo othello.MutableReversiPosition
+    .from_position); la posición original no se modifica. decode_move
+    convierte el índice de una jugada en la jugada que se regresa (por
+    ejemplo othello.decode_move). No usa canonical ni batch_utility.
+    '''
+    EXACT, LOWER_BOUND, UPPER_BOUND = range(3)
+    NO_MOVE = -1
+
+    def __init__(self, utility=None, move_groups=None, to_mutable=None,
+                 decode_move=None, tt_size=1 << 20, **kwargs):
+        super().__init__(utility, tt_size=tt_size, **kwargs)
+        if self.canonical or self.batch_utility is not None:
+            raise ValueError('MutableNegamax no usa canonical ni '
+                             'batch_utility')
+        self.trans_table = PackedTranspositionTable(tt_size)
+        self.move_groups = move_groups or {1: (-1,), -1: (-1,)}
+        self.to_mutable = to_mutable or (lambda pos: pos)
+        self.decode_move = decode_move or (lambda square: square)
+        self.search_ply = 0
+        self.root_move = self.NO_MOVE
+
+    def search_depth(self, pos, depth, guess=None):
+        pos = self.to_mutable(pos)
+        self.search_ply = 0
+        try:
+            return super().search_depth(pos, depth, guess)
+        except SearchTimeout:
+            # Se interrumpió a media rama: se deshacen las jugadas hasta
+            # regresar a la raíz
+            while self.search_ply:
+                pos.unmake()
+                self.search_ply -= 1
+            raise
+
+    def nega_run(self, pos, depth, alpha, beta, player):
+        self.root_move = self.NO_MOVE
+        score = self.search(pos, depth, alpha, beta, player)
+        return score, self.decode_move(self.root_move)
+
+    def tt_move(self, pos):
+        i = self.trans_table.probe_slot(self.to_mutable(pos).key())
+        if i < 0:
+            return None
+        return self.decode_move(self.trans_table.data[i] >> 2)
+
+    def search(self, pos, depth, alpha, beta, player):
+        '''
+        Lo mismo que Negamax.nega_run, pero regresa solo el valor; la mejor
+        jugada de la raíz queda en root_move (como índice).
+        '''
+        self.nodes += 1
+        if self.nodes >= self.next_check:
+            self.check_time()
+        stats = self.stats
+        table = self.trans_table
+        original_alpha = alpha
+
+        key = pos.key()
+        i = table.probe_slot(key)
+        if stats is not None:
+            stats.nodes += 1
+            stats.tt_probes += 1
+            stats.tt_hits += i >= 0
+        tt_move = self.NO_MOVE
+        if i >= 0:
+            data = table.data[i]
+            tt_move = data >> 2
+            if table.depths[i] >= depth:
+                flag, value = data & 3, table.entries[i]
+                if flag == self.LOWER_BOUND:
+                    alpha = max(alpha, value)
+                elif flag == self.UPPER_BOUND:
+                    beta = min(beta, value)
+                if flag == self.EXACT or alpha >= beta:
+                    if stats is not None:
+                        stats.tt_cutoffs += 1
+                    if depth == self.root_depth:
+                        self.root_move = tt_move
+                    return value
+
+        if depth == 0:
+            return player * self.utility(pos)
+        moves = pos.move_mask()
+        if not moves:
+            if pos.terminal:
+                return player * self.utility(pos)
+            # La única jugada es pasar
+            tt_move = pos.PASS
+        elif tt_move != self.NO_MOVE and not moves >> tt_move & 1:
+            tt_move = self.NO_MOVE
+
+        groups = self.move_groups[player]
+        best_score = -inf
+        best_move = self.NO_MOVE
+        i = 0
+        # Grupo -1: la jugada de la tabla; después las máscaras de groups
+        for group in range(-1, len(groups)):
+            if group < 0:
+                if tt_move == self.NO_MOVE:
+                    continue
+                square, rest = tt_move, 0
+                if tt_move != pos.PASS:
+                    moves ^= 1 << tt_move
+            else:
+                rest = moves & groups[group]
+                if not rest:
+                    continue
+                moves ^= rest
+                low = rest & -rest
+                square, rest = low.bit_length() - 1, rest ^ low
+            while True:
+                pos.make_square(square)
+                self.search_ply += 1
+                if self.pvs and i:
+                    v = -self.search(pos, depth - 1,
+                                     -alpha - self.NULL_WINDOW, -alpha,
+                                     -player)
+                    if alpha < v < beta:
+                        v = -self.search(pos, depth - 1, -beta, -alpha,
+                                         -player)
+                else:
+                    v = -self.search(pos, depth - 1, -beta, -alpha, -player)
+                pos.unmake()
+                self.search_ply -= 1
+
+                if best_score < v:
+                    best_score = v
+                    best_move = square
+                if alpha < v:
+                    alpha = v
+                    if depth == self.root_depth:
+                        self.partial = self.decode_move(square)
+                    if alpha >= beta:
+                        if stats is not None:
+                            stats.cutoffs += 1
+                            stats.first_move_cutoffs += i == 0
+                        break
+                i += 1
+                if not rest:
+                    break
+                low = rest & -rest
+                square, rest = low.bit_length() - 1, rest ^ low
+            if alpha >= beta:
+                break
+
+        flag = (self.UPPER_BOUND if best_score <= original_alpha else
+                self.LOWER_BOUND if best_score >= beta else self.EXACT)
+        table.store(key, depth, best_score, best_move << 2 | flag)
+        if depth == self.root_depth:
+            self.root_move = best_move
+        return best_score
+
+
+class Ponderer:
+    '''
+    Corre engine.ponder(pos) en un hilo aparte mientras el contrario
+    piensa su jugada; stop() lo detiene y espera a que termine, y hay que
+    llamarlo antes de volver a usar engine.
+    '''
+    def __init__(self, engine, pos):
+        self.engine = engine
+        engine.stopped = False
+        self.thread = Thread(target=engine.ponder, args=(pos,), daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        self.engine.stop()
+        self.thread.join()
+        self.engine.stopped = False
+
+
+class LazySMP:
+    '''
+    Búsqueda Negamax en paralelo al estilo Lazy SMP: workers procesos
+    buscan la misma posición con profundización iterativa, compartiendo
+    una tabla de transposición en memoria compartida
+    (SharedTranspositionTable). Los procesos no se coordinan más que a
+    través de la tabla: la mitad empieza una profundidad más adelante y
+    todos menos el primero revuelven el orden de las jugadas después de
+    la primera, de manera que exploran partes distintas del árbol y se
+    pasan resultados por la tabla. Se regresa la jugada de la búsqueda
+    completa más profunda.
+
+    utility y order_moves se mandan a los procesos, así que deben ser
+    funciones definidas a nivel de módulo. Las jugadas se guardan en la
+    tabla como enteros, con encode_move y decode_move (si las jugadas ya
+    son enteros no hacen falta).
+    '''
+    def __init__(self, utility=None, order_moves=None, max_depth=10,
+                 tt_size=1 << 20, workers=None, encode_move=None,
+                 decode_move=None):
+        self.engine_args = (utility, order_moves, max_depth)
+        self.workers = workers or os.cpu_count()
+        self.trans_table = SharedTranspositionTable(
+            tt_size, entry_type=TransTableEntry._make,
+            encode_move=encode_move, decode_move=decode_move)
+        self.codec = (encode_move, decode_move)
+        self.pool = None
+
+    def __call__(self, pos, max_time=10):
+        if self.pool is None:
+            self.pool = ProcessPoolExecutor(
+                self.workers, initializer=_init_smp_worker,
+                initargs=(self.engine_args, self.trans_table.name,
+                          self.trans_table.n_buckets * 2, self.codec))
+        self.trans_table.new_search()
+        futures = [self.pool.submit(_smp_search, pos, max_time, index,
+                                    self.trans_table.age)
+                   for index in range(self.workers)]
+        results = [future.result() for future in futures]
+        depth, score, move = max(results, key=lambda r: r[0])
+        return move
+
+    def close(self):
+        if self.pool is not None:
+            self.pool.shutdown()
+            self.pool = None
+        self.trans_table.close(unlink=True)
+
+
+_smp_engine = None
+
+
+def _init_smp_worker(engine_args, table_name, table_size, codec):
+    global _smp_engine
+    _smp_engine = Negamax(*engine_args)
+    encode_move, decode_move = codec
+    _smp_engine.trans_table = SharedTranspositionTable(
+        table_size, name=table_name, entry_type=TransTableEntry._make,
+        encode_move=encode_move, decode_move=decode_move)
+
+
+def _smp_search(pos, max_time, index, age):
+    '''
+    Profundización iterativa de un proceso de LazySMP. Regresa
+    (profundidad, valor, jugada) de la última iteración completa.
+    '''
+    engine = _smp_engine
+    engine.trans_table.new_search(age)
+    if index:
+        rng = random.Random(index)
+        order_moves = engine.order_moves
+
+        def perturbed_order(position):
+            moves = list(order_moves(position))
+            tail = moves[1:]
+            rng.shuffle(tail)
+            return moves[:1] + tail
+        engine.order_moves = perturbed_order
+
+    branching_factor = len(list(pos.legal_moves))
+    start_time = perf_counter()
+    result = (0, None, next(iter(pos.legal_moves)))
+    try:
+        for depth in range(2 + index % 2, engine.max_depth):
+            local_start = perf_counter()
+            score, move = engine.nega_run(pos, depth, -inf, inf, pos.player)
+            local_end = perf_counter()
+            result = (depth, score, move)
+            if (branching_factor * (local_end - local_start) >
+                    start_time + max_time - local_end):
+                break
+    finally:
+        if index:
+            engine.order_moves = order_moves
+    return result
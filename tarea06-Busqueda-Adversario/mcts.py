@@ -0,0 +1,229 @@
+"""
+mcts.py
+-------
+
+Búsqueda de árbol Monte Carlo (UCT) para cualquier Position de games.py:
+en lugar de una función de utilidad, cada posición se evalúa jugando una
+partida al azar (o con una política ligera) hasta el final, y el árbol
+crece hacia las jugadas que mejor resultado han dado, balanceando con UCB1
+las que casi no se han probado.
+
+Los nodos no son objetos: el árbol se guarda en arreglos paralelos
+(array.array) indexados por número de nodo, y los hijos de cada nodo
+ocupan índices consecutivos, así que basta guardar el primero y cuántos
+son. Las posiciones tampoco se guardan, se reconstruyen jugando desde la
+raíz en cada descenso.
+
+Entre llamadas se conserva el subárbol de la posición que se pide (si
+está a una o dos jugadas de la raíz anterior), de manera que al jugar una
+partida con play() las simulaciones de la jugada anterior se aprovechan.
+"""
+
+from array import array
+from collections import deque
+from time import perf_counter
+import math
+import random
+
+__author__ = 'Rafael Castillo'
+
+
+def random_policy(pos, rng):
+    return rng.choice(list(pos.legal_moves))
+
+
+class MCTS:
+    '''
+    Motor UCT. Se usa igual que games.Negamax: mcts(pos, max_time) regresa
+    la jugada con más visitas de la raíz después de buscar max_time
+    segundos, o playouts simulaciones si playouts no es None.
+
+    policy(pos, rng) escoge las jugadas de las simulaciones (al azar por
+    omisión) y result(pos) regresa el ganador de una posición terminal (1,
+    -1, o 0 si es empate; por omisión pos.terminal). Si playout no es None,
+    playout(pos, rng) hace toda la simulación y regresa el ganador (por
+    ejemplo othello.random_playout, que juega sobre los bitboards sin crear
+    una posición por jugada).
+
+    c es la constante de exploración de UCB1 y max_nodes el tamaño máximo
+    del árbol, después del cual ya no se expanden nodos. Si time_manager no
+    es None y se da remaining, el tiempo de la jugada lo decide
+    time_manager.allocate.
+    '''
+    def __init__(self, policy=None, result=None, playout=None, c=1.4,
+                 playouts=None, max_nodes=1 << 20, time_manager=None,
+                 seed=None):
+        self.policy = policy or random_policy
+        self.result = result or (lambda pos: pos.terminal)
+        self.playout = playout
+        self.c = c
+        self.playouts = playouts
+        self.max_nodes = max_nodes
+        self.time_manager = time_manager
+        self.rng = random.Random(seed)
+        self.nodes = 0
+        self.root_pos = None
+        self.clear()
+
+    def clear(self):
+        # El nodo i es la posición después de jugar moves[i] desde
+        # parent[i]; mover[i] es el jugador que hizo esa jugada, y wins[i]
+        # la suma de sus resultados (1 si gana, 0.5 si empata) en las
+        # visits[i] simulaciones que pasaron por el nodo
+        self.parent = array('i')
+        self.first_child = array('i')
+        self.n_children = array('i')
+        self.visits = array('i')
+        self.wins = array('d')
+        self.mover = array('b')
+        self.moves = []
+
+    def add_node(self, parent, move, mover, visits=0, wins=0.0):
+        self.parent.append(parent)
+        self.first_child.append(-1)
+        self.n_children.append(0)
+        self.visits.append(visits)
+        self.wins.append(wins)
+        self.mover.append(mover)
+        self.moves.append(move)
+        return len(self.moves) - 1
+
+    def __len__(self):
+        return len(self.moves)
+
+    def __call__(self, pos, max_time=10, remaining=None):
+        tm = self.time_manager
+        if tm is not None and remaining is not None:
+            max_time = tm.allocate(pos, remaining)
+        if tm is not None:
+            tm.start(max_time)
+        start = perf_counter()
+        deadline = start + max_time
+
+        self.set_root(pos)
+        count = 0
+        now = perf_counter()
+        # No se empieza una simulación si, con lo que han tardado en
+        # promedio, no alcanzaría a terminar antes de deadline
+        while (count < self.playouts if self.playouts is not None else
+               now + (now - start) / (count or 1) < deadline):
+            self.iterate(pos)
+            count += 1
+            now = perf_counter()
+        if tm is not None:
+            tm.finish()
+
+        first, n = self.first_child[0], self.n_children[0]
+        if first < 0:
+            return next(iter(pos.legal_moves))
+        best = max(range(first, first + n), key=self.visits.__getitem__)
+        return self.moves[best]
+
+    def set_root(self, pos):
+        '''
+        Pone pos en la raíz del árbol, conservando su subárbol si pos es la
+        raíz anterior o está a una o dos jugadas de ella.
+        '''
+        key = pos.hashable_pos()
+        if self.root_pos is not None:
+            frontier = [(0, self.root_pos)]
+            for _ in range(3):
+                for node, node_pos in frontier:
+                    if node_pos.hashable_pos() == key:
+                        self.reroot(node)
+                        self.root_pos = pos
+                        return
+                frontier = [(child, node_pos.make_move(self.moves[child]))
+                            for node, node_pos in frontier
+                            for child in self.children(node)]
+        self.clear()
+        self.add_node(-1, None, -pos.player)
+        self.root_pos = pos
+
+    def children(self, node):
+        first = self.first_child[node]
+        if first < 0:
+            return range(0)
+        return range(first, first + self.n_children[node])
+
+    def reroot(self, root):
+        '''
+        Deja en el árbol solo el subárbol de root, renumerado a partir de 0
+        (a lo ancho, para que los hijos sigan siendo consecutivos).
+        '''
+        if root == 0:
+            return
+        old = (self.first_child, self.n_children, self.visits, self.wins,
+               self.mover, self.moves)
+        first_child, n_children, visits, wins, mover, moves = old
+        self.clear()
+        self.add_node(-1, None, mover[root], visits[root], wins[root])
+        queue = deque([(root, 0)])
+        while queue:
+            old_node, node = queue.popleft()
+            first = first_child[old_node]
+            if first < 0:
+                continue
+            self.first_child[node] = len(self.moves)
+            self.n_children[node] = n_children[old_node]
+            for child in range(first, first + n_children[old_node]):
+                queue.append((child, self.add_node(
+                    node, moves[child], mover[child], visits[child],
+                    wins[child])))
+
+    def select_child(self, node):
+        '''
+        Hijo de node con mayor UCB1 (los que no se han visitado primero).
+        '''
+        log_n = math.log(self.visits[node])
+        visits, wins, c = self.visits, self.wins, self.c
+        best, best_score = -1, -1.0
+        for child in self.children(node):
+            n = visits[child]
+            if n == 0:
+                return child
+            score = wins[child] / n + c * math.sqrt(log_n / n)
+            if score > best_score:
+                best, best_score = child, score
+        return best
+
+    def expand(self, node, pos):
+        moves = list(pos.legal_moves)
+        self.rng.shuffle(moves)
+        self.first_child[node] = len(self.moves)
+        self.n_children[node] = len(moves)
+        for move in moves:
+            self.add_node(node, move, pos.player)
+
+    def iterate(self, pos):
+        '''
+        Una simulación: baja por el árbol con UCB1, expande la hoja, juega
+        al azar hasta el final y actualiza los nodos del camino.
+        '''
+        node = 0
+        while self.first_child[node] >= 0:
+            node = self.select_child(node)
+            pos = pos.make_move(self.moves[node])
+            self.nodes += 1
+        if not pos.terminal and len(self.moves) < self.max_nodes:
+            self.expand(node, pos)
+            node = self.first_child[node]
+            pos = pos.make_move(self.moves[node])
+            self.nodes += 1
+
+        if self.playout is not None:
+            winner = self.playout(pos, self.rng)
+        else:
+            policy, rng = self.policy, self.rng
+            while not pos.terminal:
+                pos = pos.make_move(policy(pos, rng))
+                self.nodes += 1
+            winner = self.result(pos)
+
+        while node >= 0:
+            self.visits[node] += 1
+            if winner == self.mover[node]:
+                self.wins[node] += 1.0
+            elif winner == 0:
+                self.wins[node] += 0.5
+            node = self.parent[node]
@@ -0,0 +1,84 @@
+"""
+move_ordering.py
+----------------
+
+Ordenamiento dinámico de jugadas con jugadas asesinas (killer moves) y
+heurística de historia, para usarse como ordena_jugadas en
+busquedas_adversarios.minimax o como order_moves en games.Negamax.
+
+Las búsquedas avisan al ordenamiento cada vez que una jugada produce un
+corte beta llamando a su método cutoff(juego, jugada, profundidad), y
+llaman new_search() al empezar cada búsqueda. Cualquier función de
+ordenamiento que no tenga esos métodos se sigue usando igual que antes.
+"""
+
+__author__ = 'Rafael Castillo'
+
+
+def _ply(game):
+    '''
+    Número de jugadas hechas desde el inicio del juego, para indexar las
+    jugadas asesinas.
+    '''
+    ply = getattr(game, 'ply', None)
+    if ply is not None:
+        return ply
+    return len(getattr(game, 'historial', ()))
+
+
+def _player(game):
+    player = getattr(game, 'jugador', None)
+    return game.player if player is None else player
+
+
+def _legal_moves(game):
+    if hasattr(game, 'jugadas_legales'):
+        return game.jugadas_legales()
+    return game.legal_moves
+
+
+class KillerHistoryOrder:
+    def __init__(self, base=None, n_killers=2):
+        '''
+        base es el ordenamiento estático que se usa para desempatar (por
+        ejemplo conecta4.ordena_jugadas u othello.simple_order); si es None
+        se usan las jugadas legales en su orden natural.
+        '''
+        self.base = base if base is not None else _legal_moves
+        self.n_killers = n_killers
+        self.killers = {}
+        self.history = {}
+
+    def __call__(self, game):
+        moves = list(self.base(game))
+        killers = self.killers.get(_ply(game), ())
+        player = _player(game)
+        history = self.history
+
+        def score(move):
+            if move in killers:
+                return (1 << 40) - killers.index(move)
+            return history.get((player, move), 0)
+
+        # sort es estable, así que los empates quedan en el orden de base
+        moves.sort(key=score, reverse=True)
+        return moves
+
+    def cutoff(self, game, move, depth):
+        killers = self.killers.setdefault(_ply(game), [])
+        if move in killers:
+            killers.remove(move)
+        killers.insert(0, move)
+        del killers[self.n_killers:]
+
+        key = (_player(game), move)
+        self.history[key] = self.history.get(key, 0) + depth * depth
+
+    def new_search(self):
+        '''
+        Las jugadas asesinas son de la búsqueda anterior (y de otros ply),
+        así que se olvidan; la historia se conserva pero pesa la mitad.
+        '''
+        self.killers.clear()
+        for key in self.history:
+            self.history[key] //= 2
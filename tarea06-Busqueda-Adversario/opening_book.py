@@ -0,0 +1,185 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+opening_book.py
+---------------
+
+Libros de aperturas para el otelo y el conecta 4.
+
+Las primeras jugadas de un juego siempre son las mismas, así que en lugar
+de buscarlas en cada partida se buscan una sola vez (y más profundo) con
+build_reversi_book o build_conecta4_book, que guardan un archivo con un
+registro (hash de la posición, mejor jugada, valor) por cada posición de
+las primeras plies jugadas, ordenado por hash.
+
+En el juego, OpeningBook abre el archivo con mmap (no lo lee completo) y
+busca la posición con búsqueda binaria antes de empezar cualquier
+búsqueda:
+
+    python opening_book.py othello libro_otelo.bin 4 6
+    python opening_book.py conecta4 libro_c4.bin 4 8
+
+    book = OpeningBook('libro_otelo.bin', reversi_key, decode_move)
+    Negamax(hybrid_utility, simple_order, book=book)
+
+    Conecta4GUI(libro=OpeningBook('libro_c4.bin', conecta4_key))
+"""
+
+from hashlib import blake2b
+from struct import Struct
+import mmap
+import os
+import sys
+
+__author__ = 'Rafael Castillo'
+
+# hash de 64 bits, jugada codificada como entero, valor para el que tira
+RECORD = Struct('<QHf')
+
+
+def reversi_key(pos):
+    '''
+    Hash de 64 bits de una posición de otelo, estable entre ejecuciones y
+    versiones de Python (a diferencia de hash()).
+    '''
+    from othello import array_to_bits
+    if hasattr(pos, 'white'):
+        white, black = pos.white, pos.black
+    else:
+        white, black = array_to_bits(pos.board)
+    digest = blake2b(white.to_bytes(8, 'little') +
+                     black.to_bytes(8, 'little') +
+                     (b'\x01' if pos.player == 1 else b'\x02'),
+                     digest_size=8).digest()
+    return int.from_bytes(digest, 'little')
+
+
+def conecta4_key(juego):
+    # El hash de Zobrist usa una semilla fija, así que ya es estable
+    return juego.hash
+
+
+class OpeningBook:
+    def __init__(self, path, key, decode_move=None):
+        '''
+        key calcula el hash de una posición y decode_move convierte el entero
+        guardado en una jugada (si es None las jugadas son enteros).
+        '''
+        self.key = key
+        self.decode_move = decode_move or (lambda code: code)
+        self.file = open(path, 'rb')
+        size = os.fstat(self.file.fileno()).st_size
+        self.n = size // RECORD.size
+        self.data = (mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+                     if size else b'')
+
+    def __len__(self):
+        return self.n
+
+    def lookup(self, key):
+        '''
+        Regresa (jugada codificada, valor) para el hash key, o None si la
+        posición no está en el libro.
+        '''
+        lo, hi = 0, self.n
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if RECORD.unpack_from(self.data, mid * RECORD.size)[0] < key:
+                lo = mid + 1
+            else:
+                hi = mid
+        if lo < self.n:
+            found, move, score = RECORD.unpack_from(self.data,
+                                                    lo * RECORD.size)
+            if found == key:
+                return move, score
+        return None
+
+    def move_for(self, game):
+        '''
+        Regresa la jugada del libro para game, o None si no está.
+        '''
+        entry = self.lookup(self.key(game))
+        return None if entry is None else self.decode_move(entry[0])
+
+    def close(self):
+        if self.n:
+            self.data.close()
+        self.file.close()
+
+
+def write_book(path, records):
+    '''
+    Escribe los registros (hash, jugada codificada, valor) ordenados por
+    hash, sin repetir posiciones.
+    '''
+    records = sorted(dict((key, (key, move, score))
+                          for key, move, score in records).values())
+    with open(path, 'wb') as f:
+        for record in records:
+            f.write(RECORD.pack(*record))
+    return len(records)
+
+
+def build_reversi_book(path, plies=4, depth=6, verbose=True):
+    '''
+    Busca a profundidad depth (con Negamax, PVS y hybrid_utility) todas las
+    posiciones de otelo alcanzables en menos de plies jugadas.
+    '''
+    from games import Negamax
+    from othello import make_bit_reversi, hybrid_utility, simple_order
+    from othello import encode_move
+
+    level = {reversi_key(make_bit_reversi()): make_bit_reversi()}
+    records = []
+    for ply in range(plies):
+        engine = Negamax(hybrid_utility, simple_order, pvs=True)
+        for key, pos in level.items():
+            score = None
+            for d in range(1, depth + 1):
+                score, move = engine.search_depth(pos, d, score)
+            records.append((key, encode_move(move), score))
+        if verbose:
+            print('ply {}: {} posiciones'.format(ply, len(level)))
+        level = {reversi_key(child): child
+                 for pos in level.values() for child in pos.child_nodes}
+    return write_book(path, records)
+
+
+def build_conecta4_book(path, plies=4, dmax=8, verbose=True):
+    '''
+    Busca con minimax a profundidad dmax (con utilidad_c4) todas las
+    posiciones de conecta 4 alcanzables en menos de plies jugadas.
+    '''
+    from busquedas_adversarios import minimax
+    from conecta4 import ConectaCuatroBits, utilidad_c4, ordena_jugadas
+    from transposition import TranspositionTable
+
+    transp = TranspositionTable(1 << 20)
+    records = {}
+
+    def visit(juego, ply):
+        if ply == plies or juego.terminal() is not None:
+            return
+        if juego.hash not in records:
+            move = minimax(juego, dmax=dmax - 1, utilidad=utilidad_c4,
+                           ordena_jugadas=ordena_jugadas, transp=transp)
+            # minimax guarda la raíz en la tabla con su valor exacto
+            _, score, _, _ = transp.probe(juego.hash)
+            records[juego.hash] = (juego.hash, move, juego.jugador * score)
+        for jugada in list(juego.jugadas_legales()):
+            juego.hacer_jugada(jugada)
+            visit(juego, ply + 1)
+            juego.deshacer_jugada()
+
+    visit(ConectaCuatroBits(), 0)
+    if verbose:
+        print('{} posiciones'.format(len(records)))
+    return write_book(path, records.values())
+
+
+if __name__ == '__main__':
+    game, path = sys.argv[1:3]
+    plies, depth = (int(arg) for arg in sys.argv[3:5])
+    build = build_reversi_book if game == 'othello' else build_conecta4_book
+    print('{} registros en {}'.format(build(path, plies, depth), path))
@@ -7,7 +7,11 @@ othello.py
 El juego de Otello implementado por ustes mismos, con jugador inteligente
 
 """
-from games import Position, Negamax
+from games import Position, MutablePosition, Negamax, Ponderer
+from bitboard import moves_mask, flips, popcount, iter_squares, symmetries
+from bitboard import FULL
+from endgame import EndgameSolver
+from collections import namedtuple
 from itertools import product
 import numpy as np
 import random
@@ -15,33 +19,83 @@ import random
 __author__ = 'Rafael Castillo'
 
 
+# Las 8 simetrías del tablero (rotaciones y reflejos), como funciones de
+# coordenadas, e INVERSE[k] es el índice de la simetría inversa de la k
+SYMMETRIES = (lambda r, c: (r, c), lambda r, c: (r, 7 - c),
+              lambda r, c: (7 - r, c), lambda r, c: (7 - r, 7 - c),
+              lambda r, c: (c, r), lambda r, c: (c, 7 - r),
+              lambda r, c: (7 - c, r), lambda r, c: (7 - c, 7 - r))
+INVERSE = (0, 1, 2, 3, 4, 6, 5, 7)
+
+# Para cada simetría, los índices tales que board.ravel()[perm] es el
+# tablero transformado
+SYMMETRY_PERMS = []
+for _t in SYMMETRIES:
+    _perm = [0] * 64
+    for _r, _c in product(range(8), repeat=2):
+        _tr, _tc = _t(_r, _c)
+        _perm[8 * _tr + _tc] = 8 * _r + _c
+    SYMMETRY_PERMS.append(np.array(_perm))
+del _t, _perm, _r, _c, _tr, _tc
+
+
 # -------------------------------------------------------------------------
 #              (60 puntos)
 #          INSERTE AQUI SU CÓDIGO
 # -------------------------------------------------------------------------
 class ReversiPosition(Position):
+    '''
+    Las jugadas de cada jugador se calculan con bitboards (ver bitboard.py)
+    la primera vez que se piden y se guardan en la posición como una
+    máscara por jugador, de manera que terminal, legal_moves, is_legal, el
+    ordenamiento y mobility_utility leen las mismas máscaras en lugar de
+    recorrer el tablero cada uno.
+    '''
     directions = set(product(*((-1, 0, 1),) * 2)) - {(0, 0)}
 
+    @property
+    def bits(self):
+        '''
+        Los bitboards (blancas, negras) del tablero.
+        '''
+        bits = self.__dict__.get('_bits')
+        if bits is None:
+            bits = self.__dict__['_bits'] = array_to_bits(self.board)
+        return bits
+
+    def bits_for(self, player):
+        white, black = self.bits
+        return (white, black) if player == 1 else (black, white)
+
+    def moves_mask(self, player):
+        '''
+        Máscara de las casillas donde player puede tirar (la casilla
+        (renglon, columna) es el bit renglon * 8 + columna).
+        '''
+        key = '_moves' if player == 1 else '_moves_opp'
+        mask = self.__dict__.get(key)
+        if mask is None:
+            mask = self.__dict__[key] = moves_mask(*self.bits_for(player))
+        return mask
+
+    def mobility(self, player):
+        return popcount(self.moves_mask(player))
+
     @property
     def legal_moves(self):
-        moves = list(self.moves_for(self.player))
+        moves = [divmod(sq, 8)
+                 for sq in iter_squares(self.moves_mask(self.player))]
         return moves if moves else ['pass']
 
     def moves_for(self, player):
-        return (coord for (coord, _) in np.ndenumerate(self.board)
-                if self.is_legal(coord, player))
+        return (divmod(sq, 8) for sq in iter_squares(self.moves_mask(player)))
 
     def is_legal(self, coord, player):
-        if self.board[coord]:
-            return False
-        for walk in (self.walk(d, coord, player) for d in self.directions):
-            for _ in walk:
-                return True
-        return False
+        return bool(self.moves_mask(player) >> (coord[0] * 8 + coord[1]) & 1)
 
     def make_move(self, move):
         if move == 'pass':
-            return ReversiPosition(self.board, self.player)
+            return ReversiPosition(self.board, -self.player)
 
         new_board = np.copy(self.board)
 
@@ -79,18 +133,43 @@ class ReversiPosition(Position):
 
     @property
     def terminal(self):
-        if (not np.sum(self.board == 0) or
-                (not sum(1 for _ in self.moves_for(1)) and
-                 not sum(1 for _ in self.moves_for(1)))):
-            return max((-1, 1), key=lambda p: np.sum(self.board == p))
+        white, black = self.bits
+        if ((white | black) == FULL or
+                (not self.moves_mask(1) and not self.moves_mask(-1))):
+            # Un empate se lo lleva el -1
+            return 1 if popcount(white) > popcount(black) else -1
         return 0
 
+    @property
+    def ply(self):
+        # Número de jugadas desde el inicio (sin contar los pases)
+        return int(np.count_nonzero(self.board)) - 4
+
     def hashable_pos(self):
         '''
         Uso esto porque no puedo usar un arreglo de numpy como llave de
         diccionario.
         '''
-        return self.board.tostring(), self.player
+        return self.board.tobytes(), self.player
+
+    def canonical_pos(self):
+        '''
+        Regresa (llave, k): la menor llave entre las 8 simetrías de la
+        posición, y el índice en SYMMETRIES de la simetría que la produce.
+        '''
+        flat = self.board.ravel()
+        key, k = min((flat[perm].tobytes(), k)
+                     for k, perm in enumerate(SYMMETRY_PERMS))
+        return (key, self.player), k
+
+    @staticmethod
+    def transform_move(move, k, inverse=False):
+        '''
+        Aplica a move la simetría k (o su inversa).
+        '''
+        if move is None or move == 'pass':
+            return move
+        return SYMMETRIES[INVERSE[k] if inverse else k](*move)
 
     def pprint(self, moves={}):
         '''
@@ -119,6 +198,189 @@ class ReversiPosition(Position):
                                           np.sum(self.board == -1)))
 
 
+def array_to_bits(board):
+    '''
+    Convierte un tablero de numpy en el par de bitboards (blancas, negras).
+    '''
+    def bits(mask):
+        packed = np.packbits(mask.ravel(), bitorder='little')
+        return int.from_bytes(packed.tobytes(), 'little')
+    return bits(board == 1), bits(board == -1)
+
+
+def bits_to_array(white, black):
+    def unpack(x):
+        raw = np.frombuffer(x.to_bytes(8, 'little'), dtype=np.uint8)
+        return np.unpackbits(raw, bitorder='little').astype(np.int8)
+    return (unpack(white) - unpack(black)).reshape(8, 8)
+
+
+class BitReversiPosition(namedtuple('BitReversiPosition',
+                                    ['white', 'black', 'player']),
+                         ReversiPosition):
+    '''
+    Posición de otelo guardada como dos bitboards de 64 bits (las fichas del
+    jugador 1 y las del jugador -1). Las jugadas legales y las fichas
+    volteadas se calculan con corrimientos (ver bitboard.py) en lugar de
+    recorrer el arreglo casilla por casilla.
+
+    Las jugadas son las mismas coordenadas (renglon, columna) que usa
+    ReversiPosition, y board sigue regresando un arreglo de numpy (se
+    construye solo cuando se pide y se guarda), asi que las funciones de
+    utilidad, simple_order, Negamax y play funcionan sin cambios.
+    '''
+    @property
+    def board(self):
+        board = self.__dict__.get('_board')
+        if board is None:
+            board = self.__dict__['_board'] = bits_to_array(self.white,
+                                                            self.black)
+        return board
+
+    @property
+    def bits(self):
+        return self.white, self.black
+
+    def bits_for(self, player):
+        return (self.white, self.black) if player == 1 else (self.black,
+                                                             self.white)
+
+    def make_move(self, move):
+        if move == 'pass':
+            return BitReversiPosition(self.white, self.black, -self.player)
+
+        own, opp = self.bits_for(self.player)
+        square = 1 << (move[0] * 8 + move[1])
+        flipped = flips(own, opp, square)
+        own |= square | flipped
+        opp ^= flipped
+        if self.player == 1:
+            return BitReversiPosition(own, opp, -1)
+        return BitReversiPosition(opp, own, 1)
+
+    @property
+    def ply(self):
+        return popcount(self.white | self.black) - 4
+
+    def hashable_pos(self):
+        return self.white, self.black, self.player
+
+    def canonical_pos(self):
+        key, k = min((pair, k) for k, pair in enumerate(
+            zip(symmetries(self.white), symmetries(self.black))))
+        return key + (self.player,), k
+
+    @classmethod
+    def from_position(cls, position):
+        return cls(*array_to_bits(position.board), position.player)
+
+
+class MutableReversiPosition(MutablePosition):
+    '''
+    Posición de otelo mutable, con los mismos bitboards que
+    BitReversiPosition. make(move) voltea las fichas en la misma posición y
+    agrega a history la casilla y las fichas volteadas como dos enteros
+    (ceros si es un pase), para que unmake() las regrese. board se
+    construye solo cuando se pide y se guarda mientras la posición no
+    cambie.
+
+    games.MutableNegamax usa solo enteros: las jugadas de move_mask(), que
+    hace con make_square (la casilla renglon * 8 + columna, o PASS), y la
+    llave key(); así la búsqueda no crea objetos por nodo.
+    '''
+    # Código del pase, el mismo que usa encode_move
+    PASS = 64
+
+    def __init__(self, white, black, player):
+        self.white = white
+        self.black = black
+        self.player = player
+        self.history = []
+        self._board_bits = self._board = None
+
+    # Las máscaras de jugadas no se guardan (la posición cambia), así que
+    # moves_mask se calcula cada vez
+    bits = BitReversiPosition.bits
+    bits_for = BitReversiPosition.bits_for
+
+    def moves_mask(self, player):
+        return moves_mask(*self.bits_for(player))
+
+    def move_mask(self):
+        '''
+        Máscara de las jugadas del jugador en turno.
+        '''
+        if self.player == 1:
+            return moves_mask(self.white, self.black)
+        return moves_mask(self.black, self.white)
+
+    def key(self):
+        return self.white << 65 | self.black << 1 | (self.player == 1)
+
+    mobility = ReversiPosition.mobility
+    legal_moves = ReversiPosition.legal_moves
+    moves_for = ReversiPosition.moves_for
+    is_legal = ReversiPosition.is_legal
+    make_move = BitReversiPosition.make_move
+    terminal = ReversiPosition.terminal
+    ply = BitReversiPosition.ply
+    hashable_pos = BitReversiPosition.hashable_pos
+    canonical_pos = BitReversiPosition.canonical_pos
+    transform_move = staticmethod(ReversiPosition.transform_move)
+    pprint = ReversiPosition.pprint
+
+    @property
+    def board(self):
+        if self._board_bits != (self.white, self.black):
+            self._board_bits = (self.white, self.black)
+            self._board = bits_to_array(self.white, self.black)
+        return self._board
+
+    def make(self, move):
+        self.make_square(encode_move(move))
+
+    def make_square(self, sq):
+        if sq == self.PASS:
+            square = flipped = 0
+        else:
+            square = 1 << sq
+            if self.player == 1:
+                flipped = flips(self.white, self.black, square)
+                self.white |= square | flipped
+                self.black ^= flipped
+            else:
+                flipped = flips(self.black, self.white, square)
+                self.black |= square | flipped
+                self.white ^= flipped
+        history = self.history
+        history.append(square)
+        history.append(flipped)
+        self.player = -self.player
+
+    def unmake(self):
+        flipped = self.history.pop()
+        square = self.history.pop()
+        self.player = -self.player
+        if self.player == 1:
+            self.white ^= square | flipped
+            self.black |= flipped
+        else:
+            self.black ^= square | flipped
+            self.white |= flipped
+
+    def snapshot(self):
+        '''
+        Regresa la posición actual como BitReversiPosition (inmutable).
+        '''
+        return BitReversiPosition(self.white, self.black, self.player)
+
+    @classmethod
+    def from_position(cls, position):
+        if hasattr(position, 'white'):
+            return cls(position.white, position.black, position.player)
+        return cls(*array_to_bits(position.board), position.player)
+
+
 ''' FUNCIONES DE UTILIDAD '''
 
 SQUARE_SCORE = np.array([[9, 1, 3, 3, 3, 3, 1, 9],
@@ -131,6 +393,10 @@ SQUARE_SCORE = np.array([[9, 1, 3, 3, 3, 3, 1, 9],
                          [9, 1, 3, 3, 3, 3, 1, 9]])
 
 
+# Peso de cada jugada de diferencia en mobility_utility
+MOBILITY_WEIGHT = 2
+
+
 def corner_utility(position):
     corners = position.board[[0, 0, -1, -1], [0, -1, 0, -1]]
     max_corners = len(corners == 1)
@@ -148,6 +414,16 @@ def static_utility(position):
     return np.sum(np.multiply(SQUARE_SCORE, position.board))
 
 
+def mobility_utility(position):
+    '''
+    static_utility más MOBILITY_WEIGHT por la diferencia entre las jugadas
+    disponibles de cada jugador (leídas de las máscaras que la posición ya
+    calculó para terminal y legal_moves).
+    '''
+    return (static_utility(position) + MOBILITY_WEIGHT *
+            (position.mobility(1) - position.mobility(-1)))
+
+
 def hybrid_utility(position):
     max_chips = np.sum(position.board == 1)
     min_chips = -np.sum(position.board == -1)
@@ -159,12 +435,134 @@ def hybrid_utility(position):
         return (max_chips - min_chips) / total_chips
 
 
+''' VERSIONES CON BITBOARDS (sin armar el tablero de numpy) '''
+
+# Las casillas de cada peso de SQUARE_SCORE, como (peso, máscara)
+SQUARE_WEIGHTS = tuple(
+    (int(weight), sum(1 << sq for sq in range(64)
+                      if SQUARE_SCORE[divmod(sq, 8)] == weight))
+    for weight in sorted(set(SQUARE_SCORE.flat), reverse=True))
+
+
+def bit_static_utility(position):
+    '''
+    static_utility de una posición con bitboards (white y black).
+    '''
+    white, black = position.white, position.black
+    score = 0
+    for weight, mask in SQUARE_WEIGHTS:
+        score += weight * (popcount(white & mask) - popcount(black & mask))
+    return score
+
+
+def bit_hybrid_utility(position):
+    '''
+    hybrid_utility de una posición con bitboards (white y black), con las
+    mismas cuentas.
+    '''
+    max_chips = popcount(position.white)
+    min_chips = -popcount(position.black)
+    total_chips = max_chips + min_chips
+
+    if total_chips < 48:
+        return bit_static_utility(position)
+    else:
+        return (max_chips - min_chips) / total_chips
+
+
+''' VERSIONES EN LOTE (para Negamax(batch_utility=...)) '''
+
+
+def stack_boards(positions):
+    '''
+    Apila los tableros de positions en un arreglo de (k, 8, 8). Si son
+    BitReversiPosition se desempacan todos los bitboards juntos, sin armar
+    el tablero de cada una.
+    '''
+    if not all(hasattr(p, 'white') for p in positions):
+        return np.stack([p.board for p in positions])
+    bits = np.array([(p.white, p.black) for p in positions], dtype=np.uint64)
+    squares = np.unpackbits(bits.view(np.uint8).reshape(-1, 2, 8),
+                            axis=2, bitorder='little').astype(np.int8)
+    return (squares[:, 0] - squares[:, 1]).reshape(-1, 8, 8)
+
+
+def batch_static_utility(positions):
+    boards = stack_boards(positions)
+    return np.einsum('kij,ij->k', boards, SQUARE_SCORE)
+
+
+def batch_bad_utility(positions):
+    return stack_boards(positions).sum(axis=(1, 2))
+
+
+def batch_hybrid_utility(positions):
+    '''
+    Lo mismo que hybrid_utility para cada posición, en una sola llamada.
+    '''
+    boards = stack_boards(positions)
+    max_chips = np.sum(boards == 1, axis=(1, 2))
+    min_chips = -np.sum(boards == -1, axis=(1, 2))
+    total_chips = max_chips + min_chips
+    late = total_chips >= 48
+    static = np.einsum('kij,ij->k', boards, SQUARE_SCORE)
+    ratio = np.divide(max_chips - min_chips, total_chips,
+                      out=np.zeros(len(boards)), where=late)
+    return np.where(late, ratio, static)
+
+
 def simple_order(position):
     moves = list(position.legal_moves)
+    if moves == ['pass']:
+        return moves
     moves.sort(key=lambda m: SQUARE_SCORE[m], reverse=(position.player == 1))
     return moves
 
 
+# El orden de simple_order para games.MutableNegamax(move_groups=...): las
+# máscaras de casillas de cada peso, en el orden en que se prueban
+SIMPLE_ORDER_GROUPS = {1: tuple(mask for _, mask in SQUARE_WEIGHTS),
+                       -1: tuple(mask for _, mask in SQUARE_WEIGHTS[::-1])}
+
+
+CORNERS = 0x8100000000000081
+
+
+def random_playout(position, rng, prefer_corners=True):
+    '''
+    Juega al azar desde position hasta el final directamente sobre los
+    bitboards (para mcts.MCTS), tomando una esquina cuando se puede si
+    prefer_corners. Regresa el ganador, o 0 si es empate.
+    '''
+    if isinstance(position, BitReversiPosition):
+        white, black = position.white, position.black
+    else:
+        white, black = array_to_bits(position.board)
+    player = position.player
+    own, opp = (white, black) if player == 1 else (black, white)
+    passed = False
+    while True:
+        moves = moves_mask(own, opp)
+        if not moves:
+            if passed:
+                break
+            passed = True
+        else:
+            passed = False
+            if prefer_corners and moves & CORNERS:
+                moves &= CORNERS
+            k = rng.randrange(popcount(moves))
+            for _ in range(k):
+                moves &= moves - 1
+            square = moves & -moves
+            flipped = flips(own, opp, square)
+            own |= square | flipped
+            opp ^= flipped
+        own, opp, player = opp, own, -player
+    diff = (popcount(own) - popcount(opp)) * player
+    return (diff > 0) - (diff < 0)
+
+
 def make_reversi():
     board = np.zeros((8, 8), dtype=np.int8)
     board[3, [3, 4]] = [1, -1]
@@ -172,6 +570,22 @@ def make_reversi():
     return ReversiPosition(board, 1)
 
 
+def encode_move(move):
+    '''
+    Convierte una jugada en un entero, para guardarla en tablas compartidas
+    entre procesos (games.LazySMP).
+    '''
+    return 64 if move == 'pass' else 8 * move[0] + move[1]
+
+
+def decode_move(code):
+    return 'pass' if code == 64 else divmod(code, 8)
+
+
+def make_bit_reversi():
+    return BitReversiPosition.from_position(make_reversi())
+
+
 '''
 PRECAUCION: LAS SIGUIENTES ~100 LINEAS SON COSAS DE LA INTERFAZ.
 '''
@@ -209,6 +623,23 @@ def human_player(game):
     return human_player(game)
 
 
+def pondering_player(player, engine):
+    '''
+    Envuelve a player (por ejemplo human_player) para que engine (un
+    Negamax) piense en la posición mientras player escoge su jugada, y así
+    tenga la tabla de transposición llena cuando le toque (ver
+    games.Ponderer).
+    '''
+    def wrapped(game):
+        ponderer = Ponderer(engine, game)
+        try:
+            return player(game)
+        finally:
+            ponderer.stop()
+
+    return wrapped
+
+
 # Solo dios puede juzgarme
 move_descriptions = [', ¡un movimiento excelente!',
                      '. ¡Hasta un bebé lo pudo ver venir!',
@@ -243,8 +674,9 @@ def ai_pretty_wrapper(ai):
     return wrapped
 
 
-def play(*players):
-    game = make_reversi()
+def play(*players, game=None):
+    if game is None:
+        game = make_reversi()
 
     next = 0
     while not game.terminal:
@@ -265,7 +697,8 @@ def play(*players):
 
 
 if __name__ == '__main__':
-    ai = ai_pretty_wrapper(Negamax(hybrid_utility))
+    engine = Negamax(hybrid_utility, endgame=EndgameSolver())
+    ai = ai_pretty_wrapper(engine)
     print('!' * 80)
     print('Buen dia. Este es el otelo. Si quieres cambiar quien empieza o \n'
           'ponerlo para que dos maquinas se agarren a fregazos, vas a tener \n'
@@ -274,20 +707,38 @@ if __name__ == '__main__':
 
     '''
     Afortunadamente cambiar quienes juegan es sencillo. Ahorita esta puesto
-    para jugar un humano contra un jugador de computadora:
+    para jugar un humano contra un jugador de computadora, que piensa
+    también mientras el humano escoge su jugada:
     '''
-    play(human_player, ai)
+    play(pondering_player(human_player, engine), ai)
 
     '''
+    Sin que la computadora piense en el tiempo del humano:
+
+    play(human_player, ai)
+
     Pero fácilmente  podría haber dos personas jugando entre sí (¿por qué?)
 
     play(human_player, human_player)
 
 
+    O usar varios procesos para que la computadora busque más profundo en
+    el mismo tiempo:
+
+    from games import LazySMP
+    ai = ai_pretty_wrapper(LazySMP(hybrid_utility, simple_order,
+                                   encode_move=encode_move,
+                                   decode_move=decode_move))
+
     O incluso dos maquinas (util para comparar utilidades!)
 
     other_ai = ai_pretty_wrapper(Negamax(dumb_utility))
 
     play(ai, other_ai)
 
+    Aunque para comparar utilidades en serio (muchas partidas, en varios
+    procesos, con Elo) mejor usar arena.py:
+
+    python arena.py hybrid static -n 200 --out arena.jsonl
+
     '''
@@ -0,0 +1,115 @@
+"""
+search_stats.py
+---------------
+
+Estadísticas de una búsqueda, que llenan (si se les pasa un SearchStats)
+tanto busquedas_adversarios.minimax como games.Negamax:
+
+* nodos visitados,
+* consultas, aciertos y cortes por la tabla de transposición,
+* cortes beta, y cuántos de ellos los produjo la primera jugada (con buen
+  ordenamiento casi todos),
+* nodos, tiempo y factor de ramificación efectivo de cada iteración de la
+  profundización iterativa.
+
+Los contadores son atributos que las búsquedas incrementan directamente,
+así que el costo es mínimo, y si no se pasa un SearchStats no cuestan
+nada. dump() escribe todo como una línea de JSON, para ir guardando en un
+archivo las mediciones de distintas versiones y detectar si una búsqueda
+se volvió menos eficiente.
+"""
+
+from time import perf_counter, time
+import json
+import sys
+
+__author__ = 'Rafael Castillo'
+
+
+class SearchStats:
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self.nodes = 0
+        self.tt_probes = 0
+        self.tt_hits = 0
+        self.tt_cutoffs = 0
+        self.cutoffs = 0
+        self.first_move_cutoffs = 0
+        self.iterations = []
+        self._iteration_start = None
+
+    def start_iteration(self, depth):
+        self._iteration_start = (depth, self.nodes, perf_counter())
+
+    def end_iteration(self, completed=True):
+        '''
+        Registra la iteración empezada con start_iteration; completed es
+        falso si se interrumpió (por ejemplo por tiempo).
+        '''
+        depth, nodes, start = self._iteration_start
+        nodes = self.nodes - nodes
+        previous = [it['nodes'] for it in self.iterations if it['completed']]
+        self.iterations.append({
+            'depth': depth,
+            'nodes': nodes,
+            'time': perf_counter() - start,
+            'ebf': nodes / previous[-1] if previous and previous[-1] else None,
+            'completed': completed})
+        self._iteration_start = None
+
+    @property
+    def tt_hit_rate(self):
+        return self.tt_hits / self.tt_probes if self.tt_probes else 0.0
+
+    @property
+    def first_move_cutoff_rate(self):
+        return self.first_move_cutoffs / self.cutoffs if self.cutoffs else 0.0
+
+    @property
+    def ebf(self):
+        '''
+        Factor de ramificación efectivo: nodos de la última iteración
+        completa entre los de la anterior.
+        '''
+        completed = [it for it in self.iterations
+                     if it['completed'] and it['ebf'] is not None]
+        return completed[-1]['ebf'] if completed else None
+
+    def as_dict(self):
+        return {'nodes': self.nodes,
+                'tt_probes': self.tt_probes,
+                'tt_hits': self.tt_hits,
+                'tt_hit_rate': self.tt_hit_rate,
+                'tt_cutoffs': self.tt_cutoffs,
+                'cutoffs': self.cutoffs,
+                'first_move_cutoffs': self.first_move_cutoffs,
+                'first_move_cutoff_rate': self.first_move_cutoff_rate,
+                'ebf': self.ebf,
+                'time': sum(it['time'] for it in self.iterations),
+                'iterations': list(self.iterations)}
+
+    def dump(self, file=None, **extra):
+        '''
+        Escribe las estadísticas como una línea de JSON en file (un
+        archivo abierto o una ruta, a la que se agrega la línea; por
+        omisión la salida estándar), junto con la hora y los campos de extra
+        (por ejemplo la versión del código o la posición buscada).
+        '''
+        record = dict(extra, timestamp=time(), **self.as_dict())
+        line = json.dumps(record) + '\n'
+        if file is None:
+            sys.stdout.write(line)
+        elif isinstance(file, str):
+            with open(file, 'a') as f:
+                f.write(line)
+        else:
+            file.write(line)
+        return record
+
+    def __repr__(self):
+        return ('SearchStats(nodes={}, tt_hit_rate={:.2f}, cutoffs={}, '
+                'first_move_cutoff_rate={:.2f}, ebf={})'.format(
+                    self.nodes, self.tt_hit_rate, self.cutoffs,
+                    self.first_move_cutoff_rate, self.ebf))
@@ -3,24 +3,36 @@
 
 
 from busquedas_adversarios import JuegoSumaCeros2T
-from busquedas_adversarios import minimax
 import tkinter as tk
 
 
+# Las 8 simetrías del tablero (rotaciones y reflejos) como permutaciones de
+# casillas: la casilla i del tablero transformado es la casilla s[i] del
+# original
+_ROTACION = tuple(3 * (2 - i % 3) + i // 3 for i in range(9))
+_REFLEJO = tuple(3 * (i // 3) + 2 - i % 3 for i in range(9))
+SIMETRIAS = []
+_s = tuple(range(9))
+for _ in range(4):
+    SIMETRIAS += [_s, tuple(_s[j] for j in _REFLEJO)]
+    _s = tuple(_s[j] for j in _ROTACION)
+del _s
+
+
 class Gato(JuegoSumaCeros2T):
     """
     El juego del gato para ilustrar los modelos de juegos
 
     """
+    # Las jugadas son casillas, así que las simetrías las mueven igual
+    simetrias = tuple((s, s) for s in SIMETRIAS[1:])
+
     def __init__(self, jugador=1):
         """
         Inicializa el juego del gato
 
         """
-        self.x0 = tuple(9 * [0])
-        self.x = 9 * [0]
-        self.historial = []
-        self.jugador = 1
+        super().__init__(tuple(9 * [0]))
 
     def jugadas_legales(self):
         return (posicion for posicion in range(9) if self.x[posicion] == 0)
@@ -40,13 +52,80 @@ class Gato(JuegoSumaCeros2T):
 
     def hacer_jugada(self, jugada):
         self.historial.append(jugada)
-        self.x[jugada] = self.jugador
-        self.jugador *= -1
+        self.pon_ficha(jugada, self.jugador)
+        self.cambia_turno()
 
     def deshacer_jugada(self):
         jugada = self.historial.pop()
-        self.x[jugada] = 0
-        self.jugador *= -1
+        self.pon_ficha(jugada, 0)
+        self.cambia_turno()
+
+
+def indice(x):
+    """
+    Número (de 0 a 3^9 - 1) del tablero x, en base 3 con -1 como 2.
+
+    """
+    return sum((x[i] % 3) * 3 ** i for i in range(9))
+
+
+def canonica(x):
+    """
+    Regresa (indice, s), el menor índice de las 8 simetrías del tablero x y
+    la simetría s que lo produce.
+
+    """
+    return min((indice(tuple(x[j] for j in s)), s) for s in SIMETRIAS)
+
+
+def resuelve_gato():
+    """
+    Resuelve el gato completo (una sola vez, al importar el módulo) y
+    regresa la política: un bytearray de 3^9 casillas, una por tablero, con
+    la mejor jugada + 1 de cada tablero canónico no terminal (0 en el
+    resto). Las jugadas se guardan en el marco del tablero canónico.
+
+    Entre las jugadas con el mismo resultado se prefiere la que gana más
+    rápido (o pierde más lento).
+
+    """
+    politica = bytearray(3 ** 9)
+    valores = {}
+    juego = Gato()
+
+    def negamax():
+        # Valor para el jugador en turno: casillas vacías + 1 si gana
+        ganador = juego.terminal()
+        if ganador is not None:
+            return juego.jugador * ganador * (1 + juego.x.count(0))
+        llave, s = canonica(juego.x)
+        if llave in valores:
+            return valores[llave]
+        mejor, mejor_jugada = -100, None
+        for jugada in list(juego.jugadas_legales()):
+            juego.hacer_jugada(jugada)
+            valor = -negamax()
+            juego.deshacer_jugada()
+            if valor > mejor:
+                mejor, mejor_jugada = valor, jugada
+        valores[llave] = mejor
+        politica[llave] = s.index(mejor_jugada) + 1
+        return mejor
+
+    negamax()
+    return politica
+
+
+POLITICA = resuelve_gato()
+
+
+def jugada_gato(juego):
+    """
+    La mejor jugada de juego, consultando la política precalculada.
+
+    """
+    llave, s = canonica(juego.x)
+    return s[POLITICA[llave] - 1]
 
 
 def juega_gato(jugador='X'):
@@ -60,7 +139,7 @@ def juega_gato(jugador='X'):
     print("y tu juegas con {}".format(jugador).center(60))
 
     if jugador is 'O':
-        jugada = minimax(juego)
+        jugada = jugada_gato(juego)
         juego.hacer_jugada(jugada)
 
     acabado = False
@@ -84,7 +163,7 @@ def juega_gato(jugador='X'):
         if juego.terminal() is not None:
             acabado = True
         else:
-            jugada = minimax(juego)
+            jugada = jugada_gato(juego)
             juego.hacer_jugada(jugada)
             if juego.terminal() is not None:
                 acabado = True
@@ -152,7 +231,7 @@ class GatoTK:
         juego = Gato()
 
         if not primero:
-            jugada = minimax(juego)
+            jugada = jugada_gato(juego)
             juego.hacer_jugada(jugada)
 
         self.anuncio['text'] = "A ver de que cuero salen más correas"
@@ -163,7 +242,7 @@ class GatoTK:
             ganador = juego.terminal()
             if ganador is not None:
                 break
-            jugada = minimax(juego)
+            jugada = jugada_gato(juego)
             juego.hacer_jugada(jugada)
             ganador = juego.terminal()
             if ganador is not None:
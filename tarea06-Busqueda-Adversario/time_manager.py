@@ -0,0 +1,92 @@
+"""
+time_manager.py
+---------------
+
+Manejo del tiempo de Negamax. Un TimeManager reparte el tiempo que le
+queda a un jugador en el reloj entre las jugadas que le faltan (según la
+fase del juego, con pos.ply), y pone una fecha límite dura a cada búsqueda:
+Negamax llama check() cada check_every nodos, y si ya pasó el límite se
+lanza SearchTimeout, que interrumpe la iteración en curso. Negamax regresa
+entonces la mejor jugada de la raíz que alcanzó a encontrar en esa
+iteración, o la de la última iteración completa.
+
+Cada búsqueda queda registrada en history como (presupuesto, tiempo usado),
+y overrun_stats() resume cuánto se pasaron del presupuesto.
+"""
+
+from time import perf_counter
+
+__author__ = 'Rafael Castillo'
+
+
+class SearchTimeout(Exception):
+    '''
+    Se acabó el tiempo de la búsqueda.
+    '''
+
+
+class TimeManager:
+    '''
+    game_length es el número de plies de una partida típica (60 en otelo) y
+    min_moves el mínimo de jugadas propias entre las que se reparte el
+    reloj, para que al final no se gaste todo en una sola. Ninguna jugada
+    recibe más de max_fraction del tiempo restante, y a todas se les quita
+    safety segundos para lo que tarda en regresar la búsqueda después de
+    la fecha límite.
+    '''
+    def __init__(self, game_length=60, min_moves=4, max_fraction=0.25,
+                 safety=0.01, check_every=256):
+        self.game_length = game_length
+        self.min_moves = min_moves
+        self.max_fraction = max_fraction
+        self.safety = safety
+        self.check_every = check_every
+        self.deadline = None
+        self.budget = None
+        self.start_time = None
+        self.history = []
+
+    def allocate(self, pos, remaining):
+        '''
+        Presupuesto en segundos para buscar pos cuando quedan remaining
+        segundos en el reloj.
+        '''
+        moves_left = max(self.min_moves,
+                         (self.game_length - pos.ply + 1) // 2)
+        budget = min(remaining / moves_left,
+                     remaining * self.max_fraction)
+        return max(budget - self.safety, 0.0)
+
+    def start(self, budget):
+        self.budget = budget
+        self.start_time = perf_counter()
+        self.deadline = self.start_time + budget
+
+    def check(self):
+        if perf_counter() > self.deadline:
+            raise SearchTimeout()
+
+    def remaining(self):
+        return self.deadline - perf_counter()
+
+    def finish(self):
+        '''
+        Registra la búsqueda que empezó con start y regresa el tiempo usado.
+        '''
+        used = perf_counter() - self.start_time
+        self.history.append((self.budget, used))
+        self.deadline = None
+        return used
+
+    def overrun_stats(self):
+        '''
+        Regresa un diccionario con el número de búsquedas, cuántas se
+        pasaron de su presupuesto, y el exceso máximo y promedio en segundos.
+        '''
+        overruns = [used - budget for budget, used in self.history
+                    if used > budget]
+        return {'searches': len(self.history),
+                'overruns': len(overruns),
+                'max_overrun': max(overruns, default=0.0),
+                'mean_overrun': (sum(overruns) / len(overruns)
+                                 if overruns else 0.0)}
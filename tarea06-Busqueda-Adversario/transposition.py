@@ -0,0 +1,279 @@
+"""
+transposition.py
+----------------
+
+Tabla de transposición de tamaño fijo, para usarse en lugar de un
+diccionario tanto en busquedas_adversarios.minimax como en games.Negamax.
+
+La tabla tiene un número fijo de entradas agrupadas en cubetas de dos:
+
+* La primera casilla de la cubeta prefiere profundidad: solo se reemplaza
+  si la entrada nueva es de la misma posición, viene de una búsqueda igual
+  o más profunda, o la entrada vieja es de una búsqueda anterior.
+
+* La segunda casilla siempre se reemplaza, de manera que las posiciones
+  recientes (aunque sean poco profundas) siempre tienen lugar.
+
+Cada vez que empieza una búsqueda nueva hay que llamar new_search() para
+que las entradas de búsquedas anteriores se consideren viejas y se puedan
+reemplazar, aunque sean más profundas.
+
+PackedTranspositionTable tiene la misma política, pero sus entradas son un
+valor y un entero con los demás datos empacados, guardados en listas
+paralelas, de manera que consultar y guardar no crea objetos (la usa
+games.MutableNegamax).
+"""
+
+from array import array
+from struct import pack, unpack
+
+__author__ = 'Rafael Castillo'
+
+
+class TranspositionTable:
+    def __init__(self, size=1 << 20):
+        '''
+        size es el número máximo de entradas que guarda la tabla.
+        '''
+        self.n_buckets = max(1, size // 2)
+        n = 2 * self.n_buckets
+        self.keys = [None] * n
+        self.depths = [0] * n
+        self.ages = [0] * n
+        self.entries = [None] * n
+        self.age = 0
+        self.probes = self.hits = self.stores = self.overwrites = 0
+
+    def new_search(self):
+        self.age += 1
+
+    def clear(self):
+        n = len(self.keys)
+        self.keys = [None] * n
+        self.depths = [0] * n
+        self.ages = [0] * n
+        self.entries = [None] * n
+
+    def probe(self, key):
+        '''
+        Regresa la entrada guardada para key, o None si no está.
+        '''
+        i = self.probe_slot(key)
+        return self.entries[i] if i >= 0 else None
+
+    def probe_slot(self, key):
+        '''
+        Regresa la casilla en la que está guardada key, o -1 si no está.
+        '''
+        self.probes += 1
+        i = self.bucket(key)
+        keys = self.keys
+        if keys[i] == key:
+            self.hits += 1
+            return i
+        if keys[i + 1] == key:
+            self.hits += 1
+            return i + 1
+        return -1
+
+    def store(self, key, depth, entry):
+        '''
+        Guarda entry (cualquier objeto) para key, buscada a profundidad
+        depth, siguiendo la política de reemplazo de la cubeta.
+        '''
+        self.entries[self.store_slot(key, depth)] = entry
+
+    def bucket(self, key):
+        '''
+        La primera casilla de la cubeta de key.
+        '''
+        return 2 * (hash(key) % self.n_buckets)
+
+    def store_slot(self, key, depth):
+        '''
+        Escoge, según la política de reemplazo, la casilla de la cubeta de
+        key en la que se guarda una entrada buscada a profundidad depth, le
+        pone la llave, profundidad y edad, y la regresa.
+        '''
+        self.stores += 1
+        i = self.bucket(key)
+        keys = self.keys
+        if (keys[i] is None or keys[i] == key or
+                self.ages[i] != self.age or depth >= self.depths[i]):
+            if keys[i + 1] == key:
+                keys[i + 1] = None
+                self.entries[i + 1] = None
+        else:
+            i += 1
+        if keys[i] is not None and keys[i] != key:
+            self.overwrites += 1
+        keys[i] = key
+        self.depths[i] = depth
+        self.ages[i] = self.age
+        return i
+
+    def __len__(self):
+        return sum(1 for key in self.keys if key is not None)
+
+    def stats(self):
+        '''
+        Regresa un diccionario con el uso de la tabla.
+        '''
+        return {'size': len(self.keys),
+                'used': len(self),
+                'probes': self.probes,
+                'hits': self.hits,
+                'hit_rate': self.hits / self.probes if self.probes else 0.0,
+                'stores': self.stores,
+                'overwrites': self.overwrites,
+                'age': self.age}
+
+
+class PackedTranspositionTable(TranspositionTable):
+    '''
+    TranspositionTable cuyas entradas no son objetos: cada casilla guarda
+    un valor (en entries) y un entero con el resto de los datos (en data,
+    por ejemplo la jugada y la bandera empacadas), y la profundidad queda en
+    depths. Se consulta con probe_slot, que regresa la casilla i (o -1), y
+    se leen entries[i], data[i] y depths[i]; así ni consultar ni guardar
+    crea tuplas. Las llaves deben ser enteros.
+    '''
+    def __init__(self, size=1 << 20):
+        super().__init__(size)
+        self.data = [0] * len(self.keys)
+
+    def clear(self):
+        super().clear()
+        self.data = [0] * len(self.keys)
+
+    def bucket(self, key):
+        # hash() de un entero es el entero módulo 2**61 - 1, así que con
+        # llaves como las de MutableReversiPosition (los bitboards uno
+        # tras otro) la cubeta dependería casi solo de los bits bajos de
+        # cada bitboard. Multiplicar por una constante impar grande antes
+        # revuelve todos los bits (hash de Fibonacci).
+        return 2 * (hash(key * 0x9e3779b97f4a7c15 >> 64) % self.n_buckets)
+
+    def store(self, key, depth, value, data):
+        i = self.store_slot(key, depth)
+        self.entries[i] = value
+        self.data[i] = data
+
+
+FLAGS = ('exact', 'lower_bound', 'upper_bound')
+
+
+class SharedTranspositionTable:
+    '''
+    Tabla de transposición en memoria compartida
+    (multiprocessing.shared_memory), para que varios procesos busquen con
+    la misma tabla. Tiene la misma interfaz y política de reemplazo que
+    TranspositionTable, pero solo guarda entradas de la forma
+    (flag, depth, value, move) como las de games.Negamax, con flag uno de
+    FLAGS y move un entero (o None) después de pasar por encode_move.
+
+    No usa candados: cada casilla son tres palabras de 64 bits, la llave
+    revuelta con los datos (key ^ data ^ value), los datos y el valor. Si
+    dos procesos escriben la misma casilla al mismo tiempo y la entrada
+    queda mezclada, la llave ya no coincide y la entrada simplemente se
+    ignora.
+
+    Las llaves son hash(key) de 64 bits; para que coincidan entre
+    procesos las llaves deben ser de enteros, o los procesos deben haberse
+    creado con fork (que comparten la semilla de hash).
+    '''
+    WORDS = 3
+
+    def __init__(self, size=1 << 20, name=None, entry_type=tuple,
+                 encode_move=None, decode_move=None):
+        '''
+        Si name es None se crea un bloque de memoria compartida nuevo para
+        size entradas; si no, se usa el bloque existente con ese nombre.
+        '''
+        from multiprocessing import shared_memory
+
+        self.n_buckets = max(1, size // 2)
+        n_bytes = 8 * self.WORDS * 2 * self.n_buckets
+        if name is None:
+            self.shm = shared_memory.SharedMemory(create=True, size=n_bytes)
+            self.shm.buf[:n_bytes] = bytes(n_bytes)
+        else:
+            self.shm = shared_memory.SharedMemory(name=name)
+        self.name = self.shm.name
+        self.words = self.shm.buf.cast('Q')
+        self.entry_type = entry_type
+        self.encode_move = encode_move or (lambda move: move)
+        self.decode_move = decode_move or (lambda code: code)
+        self.age = 0
+        self.probes = self.hits = self.stores = self.overwrites = 0
+
+    def new_search(self, age=None):
+        self.age = (self.age + 1 if age is None else age) & 0xff
+
+    def clear(self):
+        self.shm.buf[:] = bytes(len(self.shm.buf))
+
+    def close(self, unlink=False):
+        self.words.release()
+        self.shm.close()
+        if unlink:
+            self.shm.unlink()
+
+    def _read(self, i):
+        w = self.WORDS * i
+        check, data, value = self.words[w:w + 3]
+        return check ^ data ^ value, data, value
+
+    def probe(self, key):
+        self.probes += 1
+        key = hash(key) & 0xffffffffffffffff
+        i = 2 * (key % self.n_buckets)
+        for slot in (i, i + 1):
+            slot_key, data, value = self._read(slot)
+            if data and slot_key == key:
+                self.hits += 1
+                move = (data >> 18) & 0xffff
+                return self.entry_type((
+                    FLAGS[((data >> 16) & 3) - 1],
+                    data & 0xffff,
+                    unpack('<d', pack('<Q', value))[0],
+                    self.decode_move(move - 1) if move else None))
+        return None
+
+    def store(self, key, depth, entry):
+        self.stores += 1
+        key = hash(key) & 0xffffffffffffffff
+        i = 2 * (key % self.n_buckets)
+        slot_key, data, _ = self._read(i)
+        if (not data or slot_key == key or (data >> 34) != self.age or
+                depth >= data & 0xffff):
+            other_key, other_data, _ = self._read(i + 1)
+            if other_data and other_key == key:
+                self.words[self.WORDS * (i + 1) + 1] = 0
+        else:
+            slot_key, data, _ = self._read(i + 1)
+            i += 1
+        if data and slot_key != key:
+            self.overwrites += 1
+
+        flag, _, value, move = entry
+        move = 0 if move is None else self.encode_move(move) + 1
+        data = ((depth & 0xffff) | (FLAGS.index(flag) + 1) << 16 |
+                move << 18 | self.age << 34)
+        value = unpack('<Q', pack('<d', value))[0]
+        w = self.WORDS * i
+        self.words[w:w + 3] = array('Q', (key ^ data ^ value, data, value))
+
+    def __len__(self):
+        return sum(1 for i in range(2 * self.n_buckets)
+                   if self.words[self.WORDS * i + 1])
+
+    def stats(self):
+        return {'size': 2 * self.n_buckets,
+                'used': len(self),
+                'probes': self.probes,
+                'hits': self.hits,
+                'hit_rate': self.hits / self.probes if self.probes else 0.0,
+                'stores': self.stores,
+                'overwrites': self.overwrites,
+                'age': self.age}